@@ -1,16 +1,19 @@
 from dagster import Definitions, EnvVar
-from dagster_elt.jobs import earthquake_pipeline, dbt_earthquake_job
-from dagster_elt.schedules import earthquake_pipeline_schedule, dbt_earthquake_job_schedule
+from dagster_elt.jobs import earthquake_pipeline, dbt_earthquake_job, usgs_backfill_job
+from dagster_elt.schedules import earthquake_pipeline_schedule, usgs_backfill_schedule
 from dagster_elt.assets.airbyte.airbyte import raw_earthquake
 from dagster_elt.assets.dbt.dbt import dbt_warehouse, dbt_warehouse_resource
-from dagster_elt.resources import AirbyteResource
+from dagster_elt.assets.usgs.usgs import usgs_earthquake_window, landed_earthquake_window
+from dagster_elt.resources import AirbyteResource, LandedObjectIOManager, MappedPayloadIOManager
+from dagster_elt.sensors import airbyte_sync_sensor, dbt_raw_data_sensor
 
 
 
 defs = Definitions(
-    assets=[raw_earthquake, dbt_warehouse],
-    jobs=[earthquake_pipeline, dbt_earthquake_job],
-    schedules=[earthquake_pipeline_schedule, dbt_earthquake_job_schedule],
+    assets=[raw_earthquake, dbt_warehouse, usgs_earthquake_window, landed_earthquake_window],
+    jobs=[earthquake_pipeline, dbt_earthquake_job, usgs_backfill_job],
+    schedules=[earthquake_pipeline_schedule, usgs_backfill_schedule],
+    sensors=[airbyte_sync_sensor, dbt_raw_data_sensor],
     resources={
         "airbyte_conn": AirbyteResource(
             server_name=EnvVar("AIRBYTE_SERVER_NAME"),
@@ -19,5 +22,7 @@ defs = Definitions(
             connection_id=EnvVar('AIRBYTE_CONNECTION_ID')
         )
          ,"dbt_warehouse_resource": dbt_warehouse_resource
+         ,"landed_object_io_manager": LandedObjectIOManager()
+         ,"payload_io_manager": MappedPayloadIOManager()
      }
 )
@@ -1,11 +1,68 @@
 import os
+import datetime
+import hashlib
+import json
+import re
+import shutil
 from pathlib import Path
-from dagster_dbt import DbtCliResource, dbt_assets
-from dagster import OpExecutionContext
+from dagster_dbt import DagsterDbtTranslator, DbtCliResource, dbt_assets
+from dagster import OpExecutionContext, AssetKey, AssetObservation, AssetRecordsFilter, Config, Output
+from dagster_elt.assets.airbyte.airbyte import has_new_rows
+from earthquake_common.metrics import registry
 
 # configure dbt project resource
 dbt_project_dir = Path(__file__).joinpath("..", "..", "..", "..","..", "dbt_earthquake", "warehouse").resolve()
-dbt_warehouse_resource = DbtCliResource(project_dir=os.fspath(dbt_project_dir))
+# DBT_TARGET=local runs the project on the DuckDB target over locally landed files instead of Snowflake
+dbt_target = os.getenv("DBT_TARGET")
+dbt_warehouse_resource = DbtCliResource(project_dir=os.fspath(dbt_project_dir), target=dbt_target)
+# Directory with the manifest of a production build; models left out of a build read unbuilt parents from there
+dbt_defer_state = os.getenv("DBT_DEFER_STATE")
+
+# Everything `dbt parse` reads; a change to any of these invalidates the cached manifest
+PARSE_INPUT_DIRS = ["models", "macros", "seeds", "snapshots", "tests", "analyses"]
+PARSE_INPUT_FILES = ["dbt_project.yml", "packages.yml", "profiles.yml"]
+MANIFEST_CACHE_DIR = Path("target", "manifests")
+# env_var() calls are rendered at parse time, so their values are parse inputs too
+ENV_VAR_PATTERN = re.compile(rb"""env_var\(\s*['"](\w+)['"]""")
+
+
+def project_fingerprint(project_dir: Path, target: str = None) -> str:
+    """Content hash of the dbt project files that feed the manifest, the env vars they read and the target"""
+    sha256 = hashlib.sha256((target or "").encode())
+    paths = [project_dir / name for name in PARSE_INPUT_FILES]
+    for name in PARSE_INPUT_DIRS:
+        paths += sorted((project_dir / name).rglob("*"))
+    env_vars = set()
+    for path in paths:
+        if not path.is_file():
+            continue
+        contents = path.read_bytes()
+        sha256.update(os.fspath(path.relative_to(project_dir)).encode())
+        sha256.update(contents)
+        env_vars.update(name.decode() for name in ENV_VAR_PATTERN.findall(contents))
+    for name in sorted(env_vars):
+        sha256.update(f"{name}={os.getenv(name)}".encode())
+    return sha256.hexdigest()[:16]
+
+
+def cached_manifest_path(dbt: DbtCliResource, project_dir: Path) -> Path:
+    """Reuse the manifest parsed for the current project contents, only running `dbt parse` when they change.
+
+    Webserver, daemon and run worker processes all import this module, so an unchanged
+    project costs a directory hash instead of a full parse on every code location load.
+    """
+    target_name = dbt.target or "default"
+    target_path = MANIFEST_CACHE_DIR / f"{target_name}-{project_fingerprint(project_dir, dbt.target)}"
+    manifest_path = project_dir / target_path / "manifest.json"
+    if manifest_path.exists():
+        return manifest_path
+
+    manifest_path = dbt.cli(["--quiet", "parse"], target_path=target_path).wait().target_path.joinpath("manifest.json")
+    # Manifests for earlier versions of the project are never read again; other targets keep theirs
+    for stale in (project_dir / MANIFEST_CACHE_DIR).glob(f"{target_name}-*"):
+        if stale.name != target_path.name:
+            shutil.rmtree(stale, ignore_errors=True)
+    return manifest_path
 
 
 # DBT_DIRECTORY = Path(__file__).joinpath("..", "..", "..", "..","..", "dbt_earthquake", "warehouse").resolve()
@@ -13,19 +70,187 @@ dbt_warehouse_resource = DbtCliResource(project_dir=os.fspath(dbt_project_dir))
 
 
 
-# generate manifest
-dbt_manifest_path = (
-    dbt_warehouse_resource.cli(
-        ["--quiet", "parse"],
-        target_path=Path("target"),
-    )
-    .wait()
-    .target_path.joinpath("manifest.json")
-)
+# generate manifest, or reuse the one cached for this version of the project
+dbt_manifest_path = cached_manifest_path(dbt_warehouse_resource, dbt_project_dir)
 
 # print(dbt_manifest_path)
 
+def run_result_observations(run_results: dict, asset_keys: dict[str, AssetKey]):
+    """Export every node's timing from run_results.json as metrics, and observe it on the node's asset.
+
+    Materializations already carry dbt's execution duration; this adds rows affected and
+    the split between compiling and executing each node.
+    """
+    for result in run_results.get("results", []):
+        unique_id = result["unique_id"]
+        rows_affected = (result.get("adapter_response") or {}).get("rows_affected")
+        registry.set("dbt_node_seconds", result["execution_time"], node=unique_id)
+        if rows_affected is not None:
+            registry.set("dbt_node_rows_affected", rows_affected, node=unique_id)
+        if unique_id not in asset_keys:
+            continue
+        metadata = {"status": result["status"], "execution_seconds": result["execution_time"]}
+        if rows_affected is not None:
+            metadata["rows_affected"] = rows_affected
+        for timing in result.get("timing", []):
+            if timing.get("started_at") and timing.get("completed_at"):
+                started = datetime.datetime.fromisoformat(timing["started_at"])
+                completed = datetime.datetime.fromisoformat(timing["completed_at"])
+                metadata[f"{timing['name']}_seconds"] = (completed - started).total_seconds()
+        yield AssetObservation(asset_key=asset_keys[unique_id], metadata=metadata)
+
+
+def definition_hash(manifest: dict, unique_id: str) -> str:
+    """Hash of what a node builds: its SQL, its config and every macro it calls, directly or not.
+
+    Recorded on each materialization, so a node whose hash has changed since it was last
+    built is modified the way dbt's `state:modified` sees it, per node rather than per run.
+    """
+    node = manifest["nodes"][unique_id]
+    sha256 = hashlib.sha256(node["checksum"]["checksum"].encode())
+    sha256.update(json.dumps(node["config"], sort_keys=True, default=str).encode())
+    macros, pending = set(), list(node["depends_on"]["macros"])
+    while pending:
+        macro_id = pending.pop()
+        if macro_id in macros or macro_id not in manifest["macros"]:
+            continue
+        macros.add(macro_id)
+        pending += manifest["macros"][macro_id]["depends_on"]["macros"]
+    for macro_id in sorted(macros):
+        sha256.update(manifest["macros"][macro_id]["macro_sql"].encode())
+    return sha256.hexdigest()[:16]
+
+
+def descendants(manifest: dict, unique_ids) -> set:
+    """The given nodes and everything built from them"""
+    found, pending = set(), list(unique_ids)
+    while pending:
+        unique_id = pending.pop()
+        if unique_id not in found:
+            found.add(unique_id)
+            pending += manifest["child_map"].get(unique_id, [])
+    return found
+
+
+def topological_order(manifest: dict, unique_ids) -> list:
+    """The given models with every model before the models built from it"""
+    ordered, seen = [], set()
+
+    def visit(unique_id):
+        if unique_id in seen:
+            return
+        seen.add(unique_id)
+        for parent in manifest["nodes"][unique_id]["depends_on"]["nodes"]:
+            if parent in unique_ids:
+                visit(parent)
+        ordered.append(unique_id)
+
+    for unique_id in sorted(unique_ids):
+        visit(unique_id)
+    return ordered
+
+
+def raw_loaded_at(context: OpExecutionContext, since: float) -> float:
+    """When raw_earthquake last loaded rows after `since`, or None if no sync since then did.
+
+    Only materializations after `since` are read, so the scan is bounded by the syncs
+    since the oldest build rather than by a fixed number of recent ones.
+    """
+    records_filter = AssetRecordsFilter(asset_key=AssetKey("raw_earthquake"), after_timestamp=since)
+    cursor = None
+    while True:
+        result = context.instance.fetch_materializations(records_filter, limit=100, cursor=cursor)
+        loaded = next((record.timestamp for record in result.records if has_new_rows(record)), None)
+        if loaded is not None or not result.has_more:
+            return loaded
+        cursor = result.cursor
+
+
+def stale_models(context: OpExecutionContext, manifest: dict, asset_keys: dict[str, AssetKey],
+                 selected: set = None) -> set:
+    """The selected models whose SQL, config or macros changed since they were built, plus their descendants,
+    and tables and incremental models whose inputs changed data since their last build.
+
+    A table's inputs change when raw_earthquake loads rows after it was built, when a parent
+    table was rebuilt since, or when a parent is rebuilt in this run; views pass their parents'
+    changes through, since they read them when queried, and are never stale for new data.
+    `asset_keys` maps every model to its asset key and `selected` limits what is rebuilt.
+    """
+    selected = set(asset_keys) if selected is None else selected
+    latest = context.instance.get_latest_materialization_events(list(asset_keys.values()))
+    built = {unique_id: latest.get(asset_key) for unique_id, asset_key in asset_keys.items()}
+    modified = [
+        unique_id for unique_id in selected
+        if built[unique_id] is None
+        or "definition_hash" not in built[unique_id].asset_materialization.metadata
+        or built[unique_id].asset_materialization.metadata["definition_hash"].value != definition_hash(manifest, unique_id)
+    ]
+    stale = descendants(manifest, modified) & selected
+
+    build_times = [event.timestamp for event in built.values() if event is not None]
+    loaded_at = (raw_loaded_at(context, min(build_times)) if build_times else None) or 0
+    changed_at = {}
+    for unique_id in topological_order(manifest, set(asset_keys)):
+        node = manifest["nodes"][unique_id]
+        inputs = [
+            loaded_at if parent.startswith("source.") else changed_at.get(parent, 0)
+            for parent in node["depends_on"]["nodes"]
+        ]
+        inputs_changed = max(inputs, default=0)
+        event = built[unique_id]
+        if node["config"]["materialized"] == "view":
+            changed_at[unique_id] = inputs_changed
+            continue
+        if unique_id in selected and event is not None and inputs_changed > event.timestamp:
+            stale.add(unique_id)
+        # Rebuilt in this run, so everything built from it sees new data
+        changed_at[unique_id] = float("inf") if unique_id in stale else (event.timestamp if event else 0)
+    return stale
+
+
+def dbt_build_args(fresh: list, defer_state: str = None) -> list:
+    """`dbt build` arguments leaving the fresh models out of the run's selection"""
+    args = ["build"]
+    if fresh:
+        # Narrows the selection Dagster passes for the run, along with the fresh models' tests
+        args += ["--exclude", " ".join(fresh)]
+    if defer_state:
+        args += ["--defer", "--state", defer_state]
+    return args
+
+
+class DbtBuildConfig(Config):
+    # Build every selected model, stale or not
+    full_build: bool = False
+
+
 # load manifest to produce asset defintion
 @dbt_assets(manifest=dbt_manifest_path)
-def dbt_warehouse(context: OpExecutionContext, dbt_warehouse_resource: DbtCliResource):
-    yield from dbt_warehouse_resource.cli(["build"], context=context).stream()
\ No newline at end of file
+def dbt_warehouse(context: OpExecutionContext, dbt_warehouse_resource: DbtCliResource, config: DbtBuildConfig):
+    """Build the selected models that are stale, leaving the rest out of the dbt invocation"""
+    manifest = json.loads(dbt_manifest_path.read_text())
+    translator = DagsterDbtTranslator()
+    selected_keys = context.selected_asset_keys
+    model_keys = {
+        unique_id: translator.get_asset_key(node)
+        for unique_id, node in manifest["nodes"].items()
+        if node["resource_type"] == "model"
+    }
+    models = {unique_id: asset_key for unique_id, asset_key in model_keys.items() if asset_key in selected_keys}
+    stale = set(models) if config.full_build else stale_models(context, manifest, model_keys, set(models))
+    if not stale:
+        context.log.info(f"All {len(models)} selected dbt models are up to date, skipping dbt")
+        return
+    fresh = sorted(manifest["nodes"][unique_id]["name"] for unique_id in set(models) - stale)
+    context.log.info(f"Building {len(stale)} stale dbt models, leaving out {len(fresh)} up to date: {', '.join(fresh) or 'none'}")
+
+    invocation = dbt_warehouse_resource.cli(dbt_build_args(fresh, dbt_defer_state), context=context)
+    asset_keys = {}
+    for event in invocation.stream():
+        if isinstance(event, Output) and "unique_id" in event.metadata:
+            unique_id = event.metadata["unique_id"].value
+            asset_keys[unique_id] = context.asset_key_for_output(event.output_name)
+            if unique_id in manifest["nodes"]:
+                event = event.with_metadata({**event.metadata, "definition_hash": definition_hash(manifest, unique_id)})
+        yield event
+    yield from run_result_observations(invocation.get_artifact("run_results.json"), asset_keys)
@@ -0,0 +1,120 @@
+import datetime
+import io
+import json
+import hashlib
+import os
+import time
+import requests
+from dotenv import load_dotenv
+from dagster import asset, AssetExecutionContext, AssetMaterialization, Config, DailyPartitionsDefinition, Failure
+from dagster_elt.ops.ops import LANDED_ASSET_KEY, MULTIPART_THRESHOLD, TRANSFER_CONFIG
+from earthquake_common.landing import COMPRESSION_EXTENSIONS, encode_payload, format_event_time, get_s3_client, partition_prefix, update_manifest
+from earthquake_common.fingerprint import stamp_fingerprints
+from earthquake_common.metrics import registry
+
+# One partition per UTC day of event time, from where the historical backfill starts
+daily_partitions = DailyPartitionsDefinition(start_date="2020-01-01")
+
+# Raw USGS responses wait here for the land step; outside year=* so Airbyte never reads them
+STAGING_PREFIX = '_staging/usgs'
+
+
+class UsgsWindowConfig(Config):
+    usgs_url: str = 'https://earthquake.usgs.gov/fdsnws/event/1/query'
+
+
+@asset(
+    partitions_def=daily_partitions,
+    io_manager_key="landed_object_io_manager",
+    group_name="usgs",
+    # Caps concurrent USGS queries across a backfill's runs when a pool limit is configured for the key
+    op_tags={"dagster/concurrency_key": "usgs_api"},
+)
+def usgs_earthquake_window(context: AssetExecutionContext, config: UsgsWindowConfig) -> dict:
+    """Every event in the partition's day, streamed from the USGS FDSN API to a staging object as delivered"""
+    load_dotenv()
+    window = context.partition_time_window
+    # USGS treats endtime as inclusive, so stop 1ms short of midnight to keep 00:00:00 events in one day
+    end = window.end - datetime.timedelta(milliseconds=1)
+    params = {
+        'format': 'geojson',
+        'starttime': window.start.strftime('%Y-%m-%dT%H:%M:%S'),
+        'endtime': end.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+    }
+    count_url = config.usgs_url.rsplit('/', 1)[0] + '/count'
+    counted = requests.get(count_url, params=params, timeout=60)
+    counted.raise_for_status()
+    count, max_allowed = counted.json()['count'], counted.json().get('maxAllowed', 20000)
+    if count > max_allowed:
+        raise Failure(f"{count} events on {context.partition_key} exceeds the USGS limit of {max_allowed} per query")
+
+    bucket_name = os.getenv('S3_BUCKET')
+    s3_client = get_s3_client(os.getenv('AWS_REGION'))
+    key = f"{STAGING_PREFIX}/{context.partition_key}.json"
+    started = time.perf_counter()
+    with requests.get(config.usgs_url, params=params, stream=True, timeout=(5, 300)) as response:
+        response.raise_for_status()
+        # The body goes straight to S3 in multipart-sized reads, never parsed or held whole
+        response.raw.decode_content = True
+        s3_client.upload_fileobj(response.raw, bucket_name, key, Config=TRANSFER_CONFIG)
+    request_seconds = time.perf_counter() - started
+    size = s3_client.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+    registry.observe('usgs_request_seconds', request_seconds)
+    registry.inc('usgs_requests_total', status=response.status_code)
+    registry.inc('usgs_response_bytes_total', size)
+    registry.inc('usgs_features_total', count)
+    context.log.info(f"Staged {count} events for {context.partition_key} at s3://{bucket_name}/{key} ({size} bytes in {request_seconds:.2f}s)")
+    context.add_output_metadata({"request_seconds": request_seconds})
+    return {"bucket": bucket_name, "key": key, "bytes": size, "rows": count}
+
+
+@asset(
+    partitions_def=daily_partitions,
+    io_manager_key="landed_object_io_manager",
+    group_name="usgs",
+)
+def landed_earthquake_window(context: AssetExecutionContext, usgs_earthquake_window: dict) -> dict:
+    """The partition's events fingerprinted and landed under its year=/month=/day= prefix for Airbyte.
+
+    The object name is fixed per partition, so rematerializing a day replaces its file
+    and manifest entry instead of landing the events twice. The staging object is
+    deleted once the day has landed.
+    """
+    load_dotenv()
+    compression = os.getenv('S3_COMPRESSION') or None
+    s3_client = get_s3_client(os.getenv('AWS_REGION'))
+    staged = s3_client.get_object(Bucket=usgs_earthquake_window['bucket'], Key=usgs_earthquake_window['key'])
+    data = json.load(staged['Body'])
+
+    partition_date = context.partition_time_window.start.date()
+    bucket_name = os.getenv('S3_BUCKET')
+    s3_key = f"{partition_prefix(partition_date)}/usgs_{context.partition_key}.json" + COMPRESSION_EXTENSIONS.get(compression, '')
+    data['features'] = list(stamp_fingerprints(data['features']))
+    started = time.perf_counter()
+    body = encode_payload(data, compression)
+    if len(body) < MULTIPART_THRESHOLD:
+        s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=body)
+    else:
+        s3_client.upload_fileobj(io.BytesIO(body), bucket_name, s3_key, Config=TRANSFER_CONFIG)
+    upload_seconds = time.perf_counter() - started
+    registry.observe('s3_upload_seconds', upload_seconds)
+    registry.inc('s3_upload_bytes_total', len(body))
+    context.log.info(f"Landed {len(data['features'])} events at s3://{bucket_name}/{s3_key} ({len(body)} bytes in {upload_seconds:.2f}s)")
+
+    event_times = [feature['properties']['time'] for feature in data['features'] if feature.get('properties', {}).get('time') is not None]
+    update_manifest(s3_client, bucket_name, {
+        'key': s3_key,
+        'bytes': len(body),
+        'content_hash': hashlib.sha256(body).hexdigest(),
+        'rows': len(data['features']),
+        'min_event_time': format_event_time(min(event_times)) if event_times else None,
+        'max_event_time': format_event_time(max(event_times)) if event_times else None,
+    })
+    # airbyte_sync_sensor starts a sync for landings from any source through this key
+    context.log_event(AssetMaterialization(
+        asset_key=LANDED_ASSET_KEY,
+        metadata={"s3_key": s3_key, "rows": len(data['features']), "bytes": len(body), "partition": context.partition_key},
+    ))
+    s3_client.delete_object(Bucket=usgs_earthquake_window['bucket'], Key=usgs_earthquake_window['key'])
+    context.add_output_metadata({"upload_seconds": upload_seconds, "compression": compression or "none"})
+    return {"bucket": bucket_name, "key": s3_key, "bytes": len(body), "rows": len(data['features'])}
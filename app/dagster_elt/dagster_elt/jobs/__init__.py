@@ -1,7 +1,7 @@
 from dagster import job, define_asset_job, sensor, RunRequest, SkipReason
-from dagster_elt.ops.ops import fetch_earthquake_data, upload_to_s3
+from dagster_elt.ops.ops import fetch_earthquake_data, upload_to_s3, trigger_airbyte_sync
 from dagster_elt.assets.dbt.dbt import dbt_warehouse
-from dagster_elt.assets.airbyte.airbyte import raw_earthquake
+from dagster_elt.assets.usgs.usgs import usgs_earthquake_window, landed_earthquake_window, daily_partitions
 from dagster_dbt import build_dbt_asset_selection
 from ..assets.dbt.dbt import dbt_warehouse
 
@@ -13,8 +13,15 @@ dbt_earthquake_selection = build_dbt_asset_selection([dbt_warehouse], "stg_flatt
 @job
 def earthquake_pipeline():
     data = fetch_earthquake_data()
-    upload_to_s3(data)
-    raw_earthquake()
+    # The sync only starts once new data has landed in S3, and the run ends without waiting for it
+    trigger_airbyte_sync(upload_to_s3(data))
 
 
-dbt_earthquake_job = define_asset_job(name="dbt_earthquake", selection=dbt_earthquake_selection)
\ No newline at end of file
+dbt_earthquake_job = define_asset_job(name="dbt_earthquake", selection=dbt_earthquake_selection)
+
+# One run per day partition; a backfill queues them and the run queue fans them out
+usgs_backfill_job = define_asset_job(
+    name="usgs_backfill",
+    selection=[usgs_earthquake_window, landed_earthquake_window],
+    partitions_def=daily_partitions,
+)
\ No newline at end of file
@@ -3,23 +3,59 @@ import datetime
 import time
 import pytz
 from dotenv import load_dotenv
-from dagster import op, Config, OpExecutionContext
+from dagster import op, Config, OpExecutionContext, In, Out, Output, Nothing, AssetMaterialization
 import requests
-import boto3
-import json
+import hashlib
+import shutil
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
+from earthquake_common.landing import (
+    COMPRESSION_EXTENSIONS, MB, encode_payload, format_event_time, get_s3_client, partition_prefix, update_manifest,
+)
+from earthquake_common.watermark import WatermarkStore, format_usgs_time, max_updated
+from earthquake_common.response_cache import ResponseCache, cache_key, content_hash
+from earthquake_common.fingerprint import stamp_fingerprints
+from earthquake_common.metrics import registry
+from dagster_elt.resources import AirbyteResource
+
+
+MULTIPART_THRESHOLD = 16 * MB
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, multipart_chunksize=8 * MB, max_concurrency=8)
+
+# Recorded for every landed file, so syncs can be batched across runs
+LANDED_ASSET_KEY = "landed_earthquake_files"
 
 
 class EarthquakeConfig(Config):
     usgs_url:str = 'https://earthquake.usgs.gov/fdsnws/event/1/query'
+    # Once a watermark exists, look back over the USGS default 30 day window for revised events
+    watermark_lookback_days:int = 30
+
+
+def get_watermark_store() -> WatermarkStore:
+    """Watermark location is a local path or an s3:// URI, shared by the fetch and upload ops"""
+    load_dotenv()
+    return WatermarkStore(os.getenv('USGS_WATERMARK_PATH', 'usgs_watermark.json'), os.getenv('AWS_REGION'))
+
+
+def get_response_cache() -> ResponseCache:
+    load_dotenv()
+    return ResponseCache(os.getenv('USGS_CACHE_PATH', 'usgs_cache.json'))
 
 
-@op
-def fetch_earthquake_data(context: OpExecutionContext, config: EarthquakeConfig) -> dict:
+# The output is skipped when nothing changed, which skips the upload and Airbyte sync downstream.
+# It is the landed body, encoded once here and handed to upload_to_s3 as a memory-mapped file.
+@op(out=Out(dict, is_required=False, io_manager_key="payload_io_manager"))
+def fetch_earthquake_data(context: OpExecutionContext, config: EarthquakeConfig):
     # Calculate start_time and end_time
     start_time = datetime.datetime.utcnow() - datetime.timedelta(days=1)  # Current date - 1 day
     end_time = datetime.datetime.utcnow()
 
+    # Only fetch events created or revised since the last successful upload
+    watermark = get_watermark_store().read()
+    if watermark is not None:
+        start_time = end_time - datetime.timedelta(days=config.watermark_lookback_days)
+
     # Format dates in ISO 8601 format for USGS API
     start_time_str = start_time.strftime('%Y-%m-%dT%H:%M:%SZ')
     end_time_str = end_time.strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -31,19 +67,75 @@ def fetch_earthquake_data(context: OpExecutionContext, config: EarthquakeConfig)
             'starttime': start_time_str,
             'endtime': end_time_str,
         }
-        response = requests.get(config.usgs_url, params=params)
+        if watermark is not None:
+            params['updatedafter'] = format_usgs_time(watermark)
+            context.log.info(f"Fetching events updated after {params['updatedafter']}")
+        # Conditional request against the validators of the last landed payload
+        response_cache = get_response_cache()
+        key = cache_key(config.usgs_url, params)
+        started = time.perf_counter()
+        response = requests.get(config.usgs_url, params=params, headers=response_cache.conditional_headers(key))
+        request_seconds = time.perf_counter() - started
+        registry.observe('usgs_request_seconds', request_seconds)
+        registry.inc('usgs_requests_total', status=response.status_code)
+        response_bytes = len(response.content)
+        registry.inc('usgs_response_bytes_total', response_bytes)
+        if response.status_code == 304:
+            context.log.info("USGS returned 304 Not Modified, skipping the rest of the run")
+            return
         response.raise_for_status()  # This will raise an HTTPError if the response was not successful
 
         if response.status_code == 200:
             context.log.info("API retrieved data successfully")
 
-        return response.json()
+        data = response.json()
+        features = len(data.get('features', []))
+        registry.inc('usgs_features_total', features)
+        context.log.info(f"Fetched {features} features ({response_bytes} bytes) from USGS API in {request_seconds:.2f}s")
+        # Empty payloads are never landed, so they are neither hashed nor staged
+        if not data.get('features'):
+            context.log.info("No new or updated events since the last run, skipping the rest of the run")
+            return
+        data_hash = content_hash(data)
+        if response_cache.is_unchanged(key, data_hash):
+            context.log.info("USGS payload is unchanged since the last run, skipping the rest of the run")
+            return
+
+        # Staged entries are committed by upload_to_s3 once the payload has landed
+        response_cache.stage(key, response, data_hash)
+        del response
+
+        compression = os.getenv('S3_COMPRESSION') or None
+        data['features'] = list(stamp_fingerprints(data['features']))
+        started = time.perf_counter()
+        body = encode_payload(data, compression)
+        encode_seconds = time.perf_counter() - started
+        # What upload_to_s3 needs besides the body, so it never has to parse the payload
+        event_times = [feature['properties']['time'] for feature in data['features'] if feature.get('properties', {}).get('time') is not None]
+        payload = {
+            'body': body,
+            'compression': compression,
+            'content_hash': hashlib.sha256(body).hexdigest(),
+            'rows': features,
+            'min_event_time': format_event_time(min(event_times)) if event_times else None,
+            'max_event_time': format_event_time(max(event_times)) if event_times else None,
+            'max_updated': max_updated(data),
+            'encode_seconds': encode_seconds,
+        }
+        del data
+        yield Output(payload, metadata={
+            "features": features,
+            "response_bytes": response_bytes,
+            "request_seconds": request_seconds,
+            "encode_seconds": encode_seconds,
+        })
     except requests.RequestException as e:
         context.log.error(f"Failed to fetch data from USGS API: {e}")
         raise
 
-@op
-def upload_to_s3(context: OpExecutionContext, data: dict) -> None:
+@op(out=Out(Nothing))
+def upload_to_s3(context: OpExecutionContext, payload: dict):
+    """Land the body fetch_earthquake_data encoded, streaming it from the memory-mapped file as is"""
     load_dotenv()
     # Calculate start_time and end_time
     start_time = datetime.datetime.utcnow() - datetime.timedelta(days=1)  # Current date - 1 day
@@ -52,21 +144,78 @@ def upload_to_s3(context: OpExecutionContext, data: dict) -> None:
     est = pytz.timezone('US/Eastern')
     start_time_est = start_time.astimezone(est)
 
-    filename = start_time_est.strftime('%Y-%m-%dT%H-%M-%S.json')
+    compression = payload['compression']
+    body = payload['body']
+    filename = start_time_est.strftime('%Y-%m-%dT%H-%M-%S.json') + COMPRESSION_EXTENSIONS.get(compression, '')
     bucket_name = os.getenv('S3_BUCKET')
     region_name = os.getenv('AWS_REGION')
 
-    # Initialize the S3 client
-    s3_client = boto3.client('s3', region_name=region_name)
+    # Reuse the S3 client across op invocations in the same process
+    s3_client = get_s3_client(region_name)
     
     # Upload data to S3
     try:
-        s3_key = filename  # Directly use the filename as the S3 key
-        s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=json.dumps(data))
-        context.log.info(f"Data successfully uploaded to s3://{bucket_name}/{s3_key}")
+        # Land under year=/month=/day= of the run so readers can prune by partition
+        partition_date = datetime.datetime.utcnow().date()
+        s3_key = f"{partition_prefix(partition_date)}/{filename}"
+        started = time.perf_counter()
+        if len(body) < MULTIPART_THRESHOLD:
+            s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=body)
+        else:
+            # Large windows are split into parts uploaded concurrently, each read from the map
+            s3_client.upload_fileobj(body, bucket_name, s3_key, Config=TRANSFER_CONFIG)
+        upload_seconds = time.perf_counter() - started
+        registry.observe('s3_upload_seconds', upload_seconds)
+        registry.inc('s3_upload_bytes_total', len(body))
+        context.log.info(f"Data successfully uploaded to s3://{bucket_name}/{s3_key} ({len(body)} bytes in {upload_seconds:.2f}s)")
+        update_manifest(s3_client, bucket_name, {
+            'key': s3_key,
+            'bytes': len(body),
+            'content_hash': payload['content_hash'],
+            'rows': payload['rows'],
+            'min_event_time': payload['min_event_time'],
+            'max_event_time': payload['max_event_time'],
+        })
+        # Only advance the watermark and cache once the data has landed, so a failed upload is retried next run
+        get_watermark_store().advance_to(payload['max_updated'])
+        get_response_cache().commit()
+        # airbyte_sync_sensor compares landings against the latest sync to start follow-up syncs
+        context.log_event(AssetMaterialization(
+            asset_key=LANDED_ASSET_KEY,
+            metadata={
+                "s3_key": s3_key,
+                "rows": payload['rows'],
+                "bytes": len(body),
+                "compression": compression or "none",
+                "encode_seconds": payload['encode_seconds'],
+                "upload_seconds": upload_seconds,
+            },
+        ))
+        # Landed, so a retry has no use for the payload any more
+        body.close()
+        shutil.rmtree(payload['path'], ignore_errors=True)
     except (NoCredentialsError, PartialCredentialsError) as e:
         context.log.error(f"Credentials error while accessing S3: {e}")
         raise
     except ClientError as e:
         context.log.error(f"Client error while uploading to S3: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+@op(ins={"landed": In(Nothing)})
+def trigger_airbyte_sync(context: OpExecutionContext, airbyte_conn: AirbyteResource) -> str:
+    """Start the Airbyte sync, or attach to the one in flight, and return straight away.
+
+    airbyte_sync_sensor tracks the job to completion and starts a single follow-up
+    sync for files that landed after an attached job had already started.
+    """
+    airbyte_conn.valid_connection()
+    active = airbyte_conn.active_job()
+    if active is not None:
+        job_id = str(active["jobId"])
+        context.log.info(f"Sync job {job_id} is already {active.get('status')}, attaching to it instead of starting another.")
+        return job_id
+    context.log.info(f"Triggering Airbyte sync for connection ID: {airbyte_conn.connection_id}")
+    job_id = airbyte_conn.trigger_sync()
+    context.log.info(f"Sync job triggered successfully. Job ID: {job_id}")
+    return job_id
@@ -1,9 +1,181 @@
-from dagster import ConfigurableResource
+import base64
+import datetime
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Optional
+import requests
+from dagster import ConfigurableResource, ConfigurableIOManager, InputContext, OutputContext, AssetRecordsFilter
 
-class AirbyteResource(ConfigurableResource):    
+# Job statuses after which Airbyte will not touch the job again
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+
+
+def job_started_at(job: dict) -> float:
+    """Epoch seconds an Airbyte job started, falling back to its last update for jobs that never ran"""
+    value = job.get("startTime") or job.get("lastUpdatedAt")
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def parse_duration(value: str) -> float:
+    """Seconds in an ISO 8601 duration such as Airbyte's `PT1M23S`, or None if absent or malformed"""
+    match = re.fullmatch(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?)?", value or "")
+    if not value or not match:
+        return None
+    days, hours, minutes, seconds = (float(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+class AirbyteResource(ConfigurableResource):
     server_name: str
     username: str
     password: str
     connection_id: str
+    # Syncs running longer than this are cancelled by the completion sensor
+    sync_timeout_seconds: int = 3600
+
+    @property
+    def api_url(self) -> str:
+        return f"http://{self.server_name}:8001/api/public/v1"
+
+    @property
+    def headers(self) -> dict:
+        token = base64.b64encode(f"{self.username}:{self.password}".encode()).decode()
+        return {"Authorization": f"Basic {token}"}
+
+    def request(self, method: str, path: str, **kwargs) -> dict:
+        response = requests.request(method, f"{self.api_url}{path}", headers=self.headers, timeout=30, **kwargs)
+        if response.status_code != 200:
+            raise Exception(f"Airbyte request {method} {path} failed. Status code: {response.status_code}. Error message: {response.text}")
+        return response.json()
+
+    def valid_connection(self) -> bool:
+        """Check if connection is valid"""
+        response = requests.get(f"{self.api_url}/health", headers=self.headers, timeout=30)
+        if response.status_code != 200:
+            raise Exception(f"Airbyte connection is not valid. Status code: {response.status_code}. Error message: {response.text}")
+        return True
+
+    def trigger_sync(self) -> str:
+        """Start a sync for the connection and return the job id without waiting for it"""
+        job_id = self.request("POST", "/jobs", json={"connectionId": self.connection_id, "jobType": "sync"}).get("jobId")
+        if not job_id:
+            raise Exception("No jobId returned when triggering the Airbyte sync")
+        return str(job_id)
+
+    def get_job(self, job_id: str) -> dict:
+        return self.request("GET", f"/jobs/{job_id}")
+
+    def cancel_job(self, job_id: str) -> dict:
+        return self.request("DELETE", f"/jobs/{job_id}")
+
+    def latest_job(self) -> dict:
+        """Most recent sync job for the connection, or None if it has never synced"""
+        jobs = self.request("GET", "/jobs", params={
+            "connectionId": self.connection_id,
+            "jobType": "sync",
+            "limit": 1,
+            "orderBy": "createdAt|DESC",
+        }).get("data", [])
+        return jobs[0] if jobs else None
+
+    def active_job(self) -> dict:
+        """Latest sync job if it is still pending or running, otherwise None"""
+        job = self.latest_job()
+        if job is None or job.get("status") in TERMINAL_STATUSES:
+            return None
+        return job
+
+
+# Fields of a landed object reference; each is recorded as materialization metadata
+LANDED_REF_FIELDS = ("bucket", "key", "bytes", "rows")
+
+
+class LandedObjectIOManager(ConfigurableIOManager):
+    """Passes S3 object references between assets instead of pickling their payloads.
+
+    Assets write their data to S3 themselves and return a reference such as
+    `{"bucket": ..., "key": ..., "bytes": ..., "rows": ...}`. The reference is stored
+    only as the materialization's metadata, and downstream assets load it back from
+    the upstream materialization of the same partition, so any run worker can pick up
+    a partition another run produced.
+    """
+
+    def handle_output(self, context: OutputContext, obj: dict) -> None:
+        context.add_output_metadata({
+            "s3_uri": f"s3://{obj['bucket']}/{obj['key']}",
+            **{field: obj[field] for field in LANDED_REF_FIELDS if obj.get(field) is not None},
+        })
+
+    def load_input(self, context: InputContext) -> dict:
+        records_filter = AssetRecordsFilter(
+            asset_key=context.asset_key,
+            asset_partitions=[context.asset_partition_key] if context.has_asset_partitions else None,
+        )
+        records = context.instance.fetch_materializations(records_filter, limit=1).records
+        if not records:
+            raise Exception(f"No materialization of {context.asset_key.to_user_string()} to load a landed object reference from")
+        metadata = records[0].asset_materialization.metadata
+        return {field: metadata[field].value for field in LANDED_REF_FIELDS if field in metadata}
+
+
+class MappedPayloadIOManager(ConfigurableIOManager):
+    """Passes an encoded payload between ops as a file on local disk instead of a pickle.
+
+    The upstream op outputs `{"body": <bytes>, ...}`. The body is written once, as is,
+    and every other field is kept beside it as JSON; the downstream op gets the same
+    fields with `body` as a read-only memory map of the file plus the `path` of the
+    payload's directory, so it can upload the bytes without loading, parsing or
+    re-encoding them. The consumer closes the map and removes the directory once done. Steps must share a filesystem, as they
+    do under the default multiprocess executor. Payloads of runs that failed or stopped
+    before landing are pruned once they are `retention_hours` old, whenever a new one is written.
+    """
+
+    # Defaults to a directory under the system temp dir
+    base_dir: Optional[str] = None
+    # Long enough for a failed step to be retried from the payload
+    retention_hours: float = 6
+
+    def root_dir(self) -> str:
+        return self.base_dir or os.path.join(tempfile.gettempdir(), "dagster_payloads")
+
+    def payload_dir(self, context) -> str:
+        return os.path.join(self.root_dir(), f"{context.run_id}.{context.step_key}.{context.name}")
+
+    def prune(self) -> list:
+        """Remove payload directories older than `retention_hours`, returning their paths"""
+        cutoff = time.time() - self.retention_hours * 3600
+        pruned = []
+        with os.scandir(self.root_dir()) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    pruned.append(entry.path)
+        return pruned
 
+    def handle_output(self, context: OutputContext, obj: dict) -> None:
+        path = self.payload_dir(context)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "body"), "wb") as f:
+            f.write(obj["body"])
+        with open(os.path.join(path, "fields.json"), "w") as f:
+            json.dump({field: value for field, value in obj.items() if field != "body"}, f)
+        context.add_output_metadata({"path": path, "bytes": len(obj["body"])})
+        for pruned in self.prune():
+            context.log.info(f"Removed payload {pruned} left by a run that never landed it")
 
+    def load_input(self, context: InputContext) -> dict:
+        path = self.payload_dir(context.upstream_output)
+        with open(os.path.join(path, "fields.json")) as f:
+            payload = json.load(f)
+        with open(os.path.join(path, "body"), "rb") as f:
+            # The map stays valid after the file is closed
+            payload["body"] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        payload["path"] = path
+        return payload
@@ -1,5 +1,5 @@
-from dagster import ScheduleDefinition
-from dagster_elt.jobs import earthquake_pipeline, dbt_earthquake_job
+from dagster import ScheduleDefinition, build_schedule_from_partitioned_job
+from dagster_elt.jobs import earthquake_pipeline, usgs_backfill_job
 
 # earthquake_pipeline_schedule = ScheduleDefinition(job=earthquake_pipeline, cron_schedule="*/5 * * * *")
 
@@ -10,8 +10,6 @@ earthquake_pipeline_schedule = ScheduleDefinition(
     cron_schedule="*/1 * * * *"  # Every 5 minutes
 )
 
-# Schedule for dbt_earthquake_job to run every 3 minutes
-dbt_earthquake_job_schedule = ScheduleDefinition(
-    job=dbt_earthquake_job,
-    cron_schedule="*/3 * * * *"  # Every 3 minutes
-)
\ No newline at end of file
+# Lands each finished day once its partition closes, catching late USGS revisions the live job already passed.
+# Events the live job already landed are landed again; stg_flatten_raw keeps one row per load_id, so they do not duplicate
+usgs_backfill_schedule = build_schedule_from_partitioned_job(usgs_backfill_job)
\ No newline at end of file
@@ -0,0 +1,158 @@
+import json
+import time
+from dagster import sensor, AssetKey, AssetMaterialization, AssetRecordsFilter, DagsterRunStatus, RunRequest, RunsFilter, SensorEvaluationContext, SensorResult, SkipReason
+from dagster_elt.ops.ops import LANDED_ASSET_KEY
+from dagster_elt.jobs import dbt_earthquake_job
+from dagster_elt.assets.airbyte.airbyte import claimed_job_ids, has_new_rows
+from earthquake_common.metrics import registry
+from dagster_elt.resources import AirbyteResource, TERMINAL_STATUSES, job_started_at, parse_duration
+
+# Poll quickly when a sync has just started, then back off while it keeps running
+INITIAL_POLL_SECONDS = 15
+MAX_POLL_SECONDS = 240
+
+# How often new raw data is checked for; everything loaded in between is built by one dbt run
+DBT_SENSOR_INTERVAL_SECONDS = 60
+IN_FLIGHT_STATUSES = [DagsterRunStatus.QUEUED, DagsterRunStatus.NOT_STARTED, DagsterRunStatus.STARTING, DagsterRunStatus.STARTED]
+
+
+def start_follow_up_sync(context: SensorEvaluationContext, airbyte_conn: AirbyteResource, job: dict) -> str:
+    """Start one sync covering every file landed since `job` started, or return None if nothing is waiting"""
+    landed = context.instance.get_latest_materialization_event(AssetKey(LANDED_ASSET_KEY))
+    if landed is None:
+        return None
+    started = job_started_at(job) if job else None
+    if started is not None and landed.timestamp <= started:
+        return None
+    job_id = airbyte_conn.trigger_sync()
+    context.log.info(f"Started follow-up sync job {job_id} for files landed after the previous sync started.")
+    return job_id
+
+
+def landing_wait(context: SensorEvaluationContext, job: dict, covered_until: float) -> float:
+    """Seconds the oldest file landed since `covered_until` waited for `job` to start, or None if none did"""
+    started = job_started_at(job)
+    if started is None:
+        return None
+    records = context.instance.fetch_materializations(
+        AssetRecordsFilter(asset_key=AssetKey(LANDED_ASSET_KEY), after_timestamp=covered_until, before_timestamp=started),
+        limit=1,
+        ascending=True,
+    ).records
+    return started - records[0].timestamp if records else None
+
+
+@sensor(minimum_interval_seconds=INITIAL_POLL_SECONDS)
+def airbyte_sync_sensor(context: SensorEvaluationContext, airbyte_conn: AirbyteResource):
+    """Track the connection's latest Airbyte sync without holding a run worker.
+
+    Records a raw_earthquake materialization when a sync succeeds and cancels syncs
+    that run past the resource's sync timeout. Runs that land files while a sync is
+    in flight attach to it, so once it finishes a single follow-up sync is started
+    for everything that landed after it began. The cursor keeps the job being
+    tracked, when it was first seen and when to check it next.
+    """
+    state = json.loads(context.cursor) if context.cursor else {}
+    now = time.time()
+    if now < state.get("next_check", 0):
+        return SkipReason(f"Backing off until {time.strftime('%H:%M:%S', time.gmtime(state['next_check']))} UTC")
+
+    def track(job_id):
+        state.update(job_id=job_id, first_seen=now, interval=INITIAL_POLL_SECONDS, next_check=now + INITIAL_POLL_SECONDS)
+
+    job = airbyte_conn.latest_job()
+    if job is None or str(job["jobId"]) == state.get("reported"):
+        follow_up = start_follow_up_sync(context, airbyte_conn, job)
+        if follow_up is None:
+            return SkipReason("No new sync since the last one was reported" if job else "Connection has no sync jobs yet")
+        track(follow_up)
+        context.update_cursor(json.dumps(state))
+        return SkipReason(f"Started follow-up sync job {follow_up}")
+    job_id = str(job["jobId"])
+    status = job.get("status")
+
+    if job_id != state.get("job_id"):
+        state.update(job_id=job_id, first_seen=now, interval=INITIAL_POLL_SECONDS)
+
+    if status not in TERMINAL_STATUSES:
+        elapsed = now - state["first_seen"]
+        if elapsed > airbyte_conn.sync_timeout_seconds:
+            context.log.error(f"Airbyte sync job {job_id} has been {status} for {elapsed:.0f} seconds, cancelling it.")
+            airbyte_conn.cancel_job(job_id)
+            state.update(reported=job_id, next_check=0)
+            context.update_cursor(json.dumps(state))
+            return SkipReason(f"Cancelled stuck sync job {job_id}")
+        state["next_check"] = now + state["interval"]
+        state["interval"] = min(state["interval"] * 2, MAX_POLL_SECONDS)
+        context.update_cursor(json.dumps(state))
+        return SkipReason(f"Sync job {job_id} is {status}, checking again in {state['next_check'] - now:.0f} seconds")
+
+    # Files landed before this job started are covered by it; the next job's queue time starts after that
+    queue_seconds = landing_wait(context, job, state.get("covered_until"))
+    run_seconds = parse_duration(job.get("duration"))
+    if queue_seconds is not None:
+        registry.observe("airbyte_queue_seconds", queue_seconds)
+    if run_seconds is not None:
+        registry.observe("airbyte_sync_seconds", run_seconds, status=status)
+    state.update(reported=job_id, next_check=0, covered_until=job_started_at(job) or state.get("covered_until"))
+    asset_events = []
+    if job_id in claimed_job_ids(context.instance):
+        context.log.info(f"Airbyte sync job {job_id} {status}; the raw_earthquake run that started it reports it.")
+    elif status == "succeeded":
+        context.log.info(f"Airbyte sync job {job_id} completed successfully.")
+        metadata = {
+            "airbyte_job_id": job_id,
+            "rows_synced": job.get("rowsSynced"),
+            "bytes_synced": job.get("bytesSynced"),
+            "duration": job.get("duration"),
+            "run_seconds": run_seconds,
+            "queue_seconds": queue_seconds,
+        }
+        asset_events.append(
+            AssetMaterialization(
+                asset_key="raw_earthquake",
+                metadata={key: value for key, value in metadata.items() if value is not None},
+            )
+        )
+    else:
+        context.log.error(f"Airbyte sync job {job_id} {status}.")
+
+    follow_up = start_follow_up_sync(context, airbyte_conn, job)
+    if follow_up is not None:
+        track(follow_up)
+    return SensorResult(asset_events=asset_events, cursor=json.dumps(state))
+
+
+@sensor(job=dbt_earthquake_job, minimum_interval_seconds=DBT_SENSOR_INTERVAL_SECONDS)
+def dbt_raw_data_sensor(context: SensorEvaluationContext):
+    """Run the dbt models once raw_earthquake has loaded new rows.
+
+    Every materialization since the cursor is covered by a single run, and while a dbt
+    run is still queued or in progress the new ones wait for the next evaluation, so a
+    burst of syncs builds the models once. Syncs that loaded no rows only move the
+    cursor, which is the storage id of the last materialization handled.
+    """
+    cursor = int(context.cursor) if context.cursor else None
+    records = context.instance.fetch_materializations(
+        AssetRecordsFilter(asset_key=AssetKey("raw_earthquake"), after_storage_id=cursor),
+        limit=1000,
+        ascending=True,
+    ).records
+    if not records:
+        return SkipReason("No raw_earthquake materializations since the last dbt run")
+    latest = records[-1].storage_id
+    loaded = [record for record in records if has_new_rows(record)]
+    if not loaded:
+        context.update_cursor(str(latest))
+        return SkipReason(f"{len(records)} raw_earthquake syncs loaded no new rows")
+
+    in_flight = context.instance.get_run_records(RunsFilter(job_name=dbt_earthquake_job.name, statuses=IN_FLIGHT_STATUSES), limit=1)
+    if in_flight:
+        return SkipReason(f"dbt run {in_flight[0].dagster_run.run_id} is in flight, {len(loaded)} raw_earthquake syncs wait for the next run")
+
+    rows_synced = sum(record.asset_materialization.metadata["rows_synced"].value for record in loaded if "rows_synced" in record.asset_materialization.metadata)
+    context.log.info(f"Building dbt models for {len(loaded)} raw_earthquake syncs ({rows_synced} rows)")
+    return SensorResult(
+        run_requests=[RunRequest(run_key=f"raw_earthquake:{latest}", tags={"raw_earthquake/storage_id": str(latest)})],
+        cursor=str(latest),
+    )
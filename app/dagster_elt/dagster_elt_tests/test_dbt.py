@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from dagster import AssetKey, MetadataValue
+from dagster_elt.assets.dbt.dbt import dbt_build_args, definition_hash, stale_models
+
+SOURCE = "source.dbt_earthquake.earthquake.earthquake_data_raw"
+
+
+def model(name, materialized, parents, sql="select 1", macros=()):
+    return {
+        "name": name,
+        "resource_type": "model",
+        "checksum": {"checksum": sql},
+        "config": {"materialized": materialized},
+        "depends_on": {"nodes": list(parents), "macros": list(macros)},
+    }
+
+
+def project():
+    nodes = {
+        "model.stg": model("stg", "incremental", [SOURCE], macros=["macro.key"]),
+        "model.fact": model("fact", "incremental", ["model.stg"]),
+        "model.mart": model("mart", "table", ["model.fact"]),
+        "model.view": model("view", "view", ["model.mart"]),
+        "model.report": model("report", "table", ["model.view"]),
+        "model.calendar": model("calendar", "table", []),
+    }
+    child_map = {unique_id: [] for unique_id in nodes}
+    for unique_id, node in nodes.items():
+        for parent in node["depends_on"]["nodes"]:
+            child_map.setdefault(parent, []).append(unique_id)
+    macros = {
+        "macro.key": {"macro_sql": "md5", "depends_on": {"macros": ["macro.cast"]}},
+        "macro.cast": {"macro_sql": "cast", "depends_on": {"macros": []}},
+    }
+    return {"nodes": nodes, "child_map": child_map, "macros": macros}
+
+
+def materialization(manifest, unique_id, timestamp, **changes):
+    metadata = {"definition_hash": MetadataValue.text(changes.get("definition_hash") or definition_hash(manifest, unique_id))}
+    return SimpleNamespace(timestamp=timestamp, asset_materialization=SimpleNamespace(metadata=metadata))
+
+
+def context(built, raw_loads):
+    """`built` maps asset keys to their latest materialization, `raw_loads` lists (timestamp, rows_synced)"""
+    instance = MagicMock()
+    instance.get_latest_materialization_events.side_effect = lambda keys: {key: built[key] for key in keys if key in built}
+
+    def fetch_materializations(records_filter, limit, cursor=None):
+        after = records_filter.after_timestamp or 0
+        records = [
+            SimpleNamespace(timestamp=timestamp, asset_materialization=SimpleNamespace(metadata={"rows_synced": MetadataValue.int(rows)}))
+            for timestamp, rows in sorted(raw_loads, reverse=True) if timestamp > after
+        ]
+        # One record per page, so the scan has to follow the cursor past empty syncs
+        start = cursor or 0
+        return SimpleNamespace(records=records[start:start + 1], has_more=start + 1 < len(records), cursor=start + 1)
+
+    instance.fetch_materializations.side_effect = fetch_materializations
+    return SimpleNamespace(instance=instance)
+
+
+def asset_keys(manifest):
+    return {unique_id: AssetKey(node["name"]) for unique_id, node in manifest["nodes"].items()}
+
+
+def built_at(manifest, timestamp, **overrides):
+    return {AssetKey(manifest["nodes"][unique_id]["name"]): materialization(manifest, unique_id, overrides.get(unique_id, timestamp))
+            for unique_id in manifest["nodes"]}
+
+
+def test_definition_hash_follows_nested_macros():
+    manifest = project()
+    before = definition_hash(manifest, "model.stg")
+    manifest["macros"]["macro.cast"]["macro_sql"] = "try_cast"
+    assert definition_hash(manifest, "model.stg") != before
+    assert definition_hash(manifest, "model.fact") == definition_hash(project(), "model.fact")
+
+
+def test_nothing_stale_without_new_rows():
+    manifest = project()
+    # Syncs after the build loaded nothing
+    assert stale_models(context(built_at(manifest, 100.0), [(150.0, 0), (160.0, 0)]), manifest, asset_keys(manifest)) == set()
+
+
+def test_new_rows_rebuild_only_tables_on_their_path():
+    manifest = project()
+    stale = stale_models(context(built_at(manifest, 100.0), [(150.0, 12), (160.0, 0), (170.0, 0)]), manifest, asset_keys(manifest))
+    # The view passes the mart's rebuild on to the table reading it; calendar never reads raw data
+    assert stale == {"model.stg", "model.fact", "model.mart", "model.report"}
+
+
+def test_parent_rebuilt_by_an_earlier_run():
+    manifest = project()
+    # An earlier run rebuilt only the staging and fact models after new rows
+    built = built_at(manifest, 100.0, **{"model.stg": 200.0, "model.fact": 200.0})
+    assert stale_models(context(built, [(150.0, 12)]), manifest, asset_keys(manifest)) == {"model.mart", "model.report"}
+
+
+def test_unselected_parent_is_not_rebuilt():
+    manifest = project()
+    selected = {"model.mart", "model.report"}
+    stale = stale_models(context(built_at(manifest, 100.0), [(150.0, 12)]), manifest, asset_keys(manifest), selected)
+    # stg and fact are left out, so the mart only sees their last builds, from before the load
+    assert stale == set()
+
+
+def test_modified_model_and_descendants():
+    manifest = project()
+    built = built_at(manifest, 100.0)
+    built[AssetKey("mart")] = materialization(manifest, "model.mart", 100.0, definition_hash="outdated")
+    assert stale_models(context(built, []), manifest, asset_keys(manifest)) == {"model.mart", "model.view", "model.report"}
+
+
+def test_build_args():
+    assert dbt_build_args([]) == ["build"]
+    assert dbt_build_args(["calendar", "mart"], "/state") == ["build", "--exclude", "calendar mart", "--defer", "--state", "/state"]
@@ -0,0 +1,33 @@
+import os
+import time
+from dagster import build_input_context, build_output_context
+from dagster_elt.resources import MappedPayloadIOManager
+
+
+def output_context(run_id):
+    return build_output_context(run_id=run_id, step_key="fetch_earthquake_data", name="result")
+
+
+def test_payload_map_outlives_file(tmp_path):
+    io_manager = MappedPayloadIOManager(base_dir=str(tmp_path))
+    io_manager.handle_output(output_context("run1"), {"body": b'{"features": []}', "rows": 0})
+    payload = io_manager.load_input(build_input_context(upstream_output=output_context("run1")))
+    assert payload["rows"] == 0
+    # The file is closed once loaded, and the map stays readable until the consumer closes it
+    assert payload["body"][:] == b'{"features": []}'
+    payload["body"].close()
+    assert payload["body"].closed
+
+
+def test_stale_payloads_pruned(tmp_path):
+    io_manager = MappedPayloadIOManager(base_dir=str(tmp_path), retention_hours=1)
+    io_manager.handle_output(output_context("failed"), {"body": b"{}"})
+    io_manager.handle_output(output_context("running"), {"body": b"{}"})
+    # A run that failed after fetching left its payload behind two hours ago
+    stale = io_manager.payload_dir(output_context("failed"))
+    two_hours_ago = time.time() - 2 * 3600
+    os.utime(stale, (two_hours_ago, two_hours_ago))
+    io_manager.handle_output(output_context("next"), {"body": b"{}"})
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(io_manager.payload_dir(output_context(run_id))) for run_id in ("running", "next")
+    )
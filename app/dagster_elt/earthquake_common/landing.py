@@ -0,0 +1,145 @@
+import datetime
+import functools
+import json
+import zlib
+import boto3
+
+MB = 1024 * 1024
+
+# Airbyte's S3 source detects the compression from the file extension
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+# Manifests live outside the data partitions so a `year=*/**` Airbyte glob never reads them
+MANIFEST_PREFIX = '_manifests'
+
+# Partitions are dated by landing, not event time: a live run lands revisions up to its
+# lookback after the event, and a backfill chunk lands under its start, up to a month before
+MANIFEST_LATENESS_DAYS = 31
+
+# Features serialized per call to the C encoder; chunked iterencode falls back to pure Python
+ENCODE_BATCH_SIZE = 1000
+
+
+@functools.lru_cache(maxsize=None)
+def get_s3_client(region_name):
+    """boto3 clients are thread-safe and expensive to build, so share one per region"""
+    return boto3.client('s3', region_name=region_name)
+
+
+def partition_prefix(partition_date):
+    return f"year={partition_date.year}/month={partition_date.month:02d}/day={partition_date.day:02d}"
+
+
+def manifest_prefix(partition_date):
+    return f"{MANIFEST_PREFIX}/{partition_prefix(partition_date)}/"
+
+
+def manifest_key(key):
+    """Manifest entry of a landed object, mirroring its year=/month=/day= key"""
+    return f"{MANIFEST_PREFIX}/{key}.manifest.json"
+
+
+def format_event_time(epoch_ms):
+    if epoch_ms is None:
+        return None
+    return datetime.datetime.utcfromtimestamp(epoch_ms / 1000).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def parse_event_time(value):
+    """A UTC datetime from an ISO 8601 string, with or without fractional seconds or a Z suffix"""
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def feature_stats(data):
+    """Row count and event time range of a FeatureCollection dict"""
+    times = [
+        feature.get('properties', {}).get('time')
+        for feature in data.get('features', [])
+    ]
+    times = [value for value in times if value is not None]
+    return {
+        'rows': len(data.get('features', [])),
+        'min_event_time': format_event_time(min(times)) if times else None,
+        'max_event_time': format_event_time(max(times)) if times else None,
+    }
+
+
+def iter_json_chunks(data):
+    """The text of json.dumps(data), yielded in pieces of at most ENCODE_BATCH_SIZE features"""
+    yield '{'
+    for index, (name, value) in enumerate(data.items()):
+        yield (', ' if index else '') + json.dumps(name) + ': '
+        if name != 'features' or not isinstance(value, list):
+            yield json.dumps(value)
+            continue
+        yield '['
+        for start in range(0, len(value), ENCODE_BATCH_SIZE):
+            yield (', ' if start else '') + json.dumps(value[start:start + ENCODE_BATCH_SIZE])[1:-1]
+        yield ']'
+    yield '}'
+
+
+def compress_chunks(chunks, compression):
+    """Compress an iterator of byte chunks on the fly"""
+    if compression is None:
+        yield from chunks
+        return
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("zstd compression requires the zstandard package")
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        raise Exception(f"Unsupported compression: {compression}")
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def encode_chunks(data, compression=None):
+    """A FeatureCollection dict as JSON byte chunks, compressed as they are encoded"""
+    return compress_chunks((chunk.encode() for chunk in iter_json_chunks(data)), compression)
+
+
+def encode_payload(data, compression=None):
+    """Serialize data as JSON, compressing chunk by chunk as it is encoded"""
+    return b''.join(encode_chunks(data, compression))
+
+
+def read_manifest(s3_client, bucket_name, partition_date):
+    """Collect the entries of every object landed in a partition, with partition totals"""
+    files = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=manifest_prefix(partition_date)):
+        for item in page.get('Contents', []):
+            response = s3_client.get_object(Bucket=bucket_name, Key=item['Key'])
+            files.append(json.loads(response['Body'].read()))
+    event_times = [item[field] for item in files for field in ('min_event_time', 'max_event_time') if item[field]]
+    return {
+        'partition': partition_prefix(partition_date),
+        'files': files,
+        'rows': sum(item['rows'] or 0 for item in files),
+        'min_event_time': min(event_times) if event_times else None,
+        'max_event_time': max(event_times) if event_times else None,
+    }
+
+
+def update_manifest(s3_client, bucket_name, entry):
+    """Record a landed object in its own manifest entry, replacing any earlier entry for the key.
+
+    One object per landed file means writers in different processes never read, modify
+    and write back a shared manifest, so concurrent landings cannot drop each other's entries.
+    """
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=manifest_key(entry['key']),
+        Body=json.dumps(entry, indent=2),
+        ContentType='application/json',
+    )
+    return entry
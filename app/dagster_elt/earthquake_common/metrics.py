@@ -0,0 +1,146 @@
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Every metric the pipeline records: name -> (type, help). Summaries are exported as
+# <name>_count and <name>_sum, so a rate of one over the other gives the mean latency.
+METRICS = {
+    'usgs_request_seconds': ('summary', 'Latency of USGS FDSN event queries, including retries'),
+    'usgs_requests_total': ('counter', 'USGS FDSN event queries by HTTP status'),
+    'usgs_response_bytes_total': ('counter', 'Body bytes received from USGS'),
+    'usgs_features_total': ('counter', 'Features returned by USGS'),
+    's3_upload_seconds': ('summary', 'Time to encode and upload one landed file'),
+    's3_upload_bytes_total': ('counter', 'Bytes landed in S3'),
+    'airbyte_queue_seconds': ('summary', 'Time landed files waited for a sync covering them to start'),
+    'airbyte_sync_seconds': ('summary', 'Time from starting or attaching to an Airbyte sync until it finished, by status'),
+    'dbt_node_seconds': ('gauge', 'Execution time of each dbt node in its latest invocation'),
+    'dbt_node_rows_affected': ('gauge', 'Rows affected by each dbt node in its latest invocation'),
+    'pipeline_stage_seconds': ('summary', 'Wall time of each pipeline stage'),
+}
+
+
+def metric_key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels) + '}'
+
+
+class MetricsRegistry:
+    """Counters, gauges and summaries rendered in the Prometheus text exposition format.
+
+    With a `path` the values live in a JSON file shared under a file lock, so separate
+    processes (Dagster run workers) add to the same series and one endpoint serves them.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.values = {}
+
+    @contextlib.contextmanager
+    def state(self):
+        with self.lock:
+            if not self.path:
+                yield self.values
+                return
+            with open(self.path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                content = f.read()
+                values = json.loads(content) if content else {}
+                yield values
+                f.seek(0)
+                f.truncate()
+                json.dump(values, f)
+
+    def inc(self, name, value=1, **labels):
+        with self.state() as values:
+            key = metric_key(name, labels)
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.state() as values:
+            values[metric_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self.state() as values:
+            count, total = values.get(metric_key(name, labels), (0, 0))
+            values[metric_key(name, labels)] = (count + 1, total + value)
+
+    @contextlib.contextmanager
+    def time(self, name, **labels):
+        """Observe the wall time of the block, whether or not it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self.state() as values:
+            series = sorted((tuple(json.loads(key)), value) for key, value in values.items())
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            samples = [(labels, value) for (sample_name, labels), value in series if sample_name == name]
+            if not samples:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                labels = format_labels(labels)
+                if kind == 'summary':
+                    lines += [f"{name}_count{labels} {value[0]}", f"{name}_sum{labels} {value[1]}"]
+                else:
+                    lines.append(f"{name}{labels} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry the clients record into; METRICS_PATH shares it between processes
+registry = MetricsRegistry(os.getenv('METRICS_PATH'))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1', metrics_registry=None):
+    """Serve /metrics for Prometheus to scrape from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = metrics_registry or registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+if __name__ == '__main__':
+    # Standalone endpoint for a METRICS_PATH written by other processes, such as Dagster run workers
+    start_http_server(int(os.getenv('METRICS_PORT', 9108)), host=os.getenv('METRICS_HOST', '127.0.0.1'))
+    threading.Event().wait()
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The polling window slides on every run and the watermark moves after every landing, so both
+# are left out of the cache key; otherwise validators would never be looked up again
+VOLATILE_PARAMS = {'starttime', 'endtime', 'updatedafter'}
+
+# Committed entries kept, most recently committed first to go last
+MAX_ENTRIES = 100
+
+
+def cache_key(url, params):
+    stable = {key: value for key, value in params.items() if key not in VOLATILE_PARAMS}
+    return hashlib.sha256(f"{url}?{json.dumps(stable, sort_keys=True)}".encode()).hexdigest()
+
+
+def content_hash(data):
+    """Hash only the features, since the metadata block changes on every response"""
+    features = json.dumps(data.get('features', []), sort_keys=True)
+    return hashlib.sha256(features.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Local cache of ETag/Last-Modified validators and payload hashes per USGS query.
+
+    Entries are staged when a response is fetched and only committed once the payload
+    has landed, so a failed upload is never mistaken for an unchanged feed. Callers only
+    stage payloads with features, since an empty one is never landed. Staging, committing
+    and saving hold a lock, so fetch and upload threads can share one cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.pending = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.entries = state.get('entries', {})
+            self.pending = state.get('pending', {})
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def conditional_headers(self, key):
+        entry = self.get(key) or {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def is_unchanged(self, key, data_hash):
+        entry = self.get(key)
+        return entry is not None and entry.get('content_hash') == data_hash
+
+    def stage(self, key, response, data_hash):
+        # Staged entries are saved too, so the upload step can commit them from another process
+        with self.lock:
+            self.pending[key] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_hash': data_hash,
+            }
+            self.save()
+
+    def commit(self, entries=None):
+        """Promote staged entries once their payloads have landed.
+
+        `entries` limits the commit to a snapshot of `pending` taken when a payload was
+        fetched, so an upload never commits entries staged by a later fetch.
+        """
+        with self.lock:
+            entries = dict(self.pending) if entries is None else entries
+            if not entries:
+                return
+            for key, value in entries.items():
+                # Re-inserted so the least recently committed entries are pruned first
+                self.entries.pop(key, None)
+                self.entries[key] = value
+            for key in list(self.entries)[:-MAX_ENTRIES]:
+                del self.entries[key]
+            self.pending = {key: value for key, value in self.pending.items() if entries.get(key) != value}
+            self.save()
+
+    def save(self):
+        with self.lock:
+            state = json.dumps({'entries': self.entries, 'pending': self.pending})
+        # A temp file of its own, so processes sharing the path never replace each other's
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(state)
+        os.replace(tmp_path, self.path)
+        logger.debug(f"Response cache saved to {self.path}")
@@ -0,0 +1,82 @@
+import datetime
+import json
+import logging
+import os
+import boto3
+from botocore.exceptions import ClientError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def max_updated(data):
+    """Return the largest USGS `updated` timestamp (epoch ms) in a FeatureCollection"""
+    updated = [
+        feature.get('properties', {}).get('updated')
+        for feature in data.get('features', [])
+    ]
+    updated = [value for value in updated if value is not None]
+    return max(updated) if updated else None
+
+
+def format_usgs_time(updated_ms):
+    """Format an epoch ms timestamp as an ISO 8601 string accepted by the USGS API"""
+    timestamp = datetime.datetime.utcfromtimestamp(updated_ms / 1000)
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+
+class WatermarkStore:
+    """Persists the USGS `updated` high-water mark between runs.
+
+    `location` is either a local file path or an `s3://bucket/key` URI.
+    """
+
+    def __init__(self, location: str, region_name: str = 'us-east-2'):
+        self.location = location
+        self.s3_client = None
+        if location.startswith('s3://'):
+            self.bucket_name, _, self.s3_key = location[len('s3://'):].partition('/')
+            self.s3_client = boto3.client('s3', region_name=region_name)
+
+    def read(self):
+        """Return the stored watermark in epoch ms, or None on the first run"""
+        try:
+            if self.s3_client:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.s3_key)
+                state = json.loads(response['Body'].read())
+            else:
+                if not os.path.exists(self.location):
+                    return None
+                with open(self.location) as f:
+                    state = json.load(f)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            logger.error(f"Failed to read watermark from {self.location}: {e}")
+            raise
+        return state.get('updated')
+
+    def write(self, updated_ms: int) -> None:
+        state = json.dumps({'updated': updated_ms, 'updated_iso': format_usgs_time(updated_ms)})
+        if self.s3_client:
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=self.s3_key, Body=state)
+        else:
+            # Write to a temp file first so a crash never leaves a truncated watermark behind
+            tmp_path = f"{self.location}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(state)
+            os.replace(tmp_path, self.location)
+        logger.info(f"Watermark advanced to {format_usgs_time(updated_ms)} at {self.location}")
+
+    def advance(self, data):
+        """Move the watermark to the newest `updated` value in data, never backwards"""
+        return self.advance_to(max_updated(data))
+
+    def advance_to(self, candidate):
+        if candidate is None:
+            return self.read()
+        current = self.read()
+        if current is not None and candidate <= current:
+            return current
+        self.write(candidate)
+        return candidate
@@ -10,5 +10,9 @@ setup(
         "dbt-core==1.7.2",        
         "dbt-snowflake==1.7.2"
     ],
-    extras_require={"dev": ["dagster-webserver", "pytest"]},
+    extras_require={
+        "dev": ["dagster-webserver", "pytest"],
+        # dbt's `local` target: DuckDB over locally landed files
+        "local": ["dbt-duckdb==1.7.5"],
+    },
 )
\ No newline at end of file
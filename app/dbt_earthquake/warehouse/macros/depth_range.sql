@@ -0,0 +1,7 @@
+{% macro depth_range(depth) -%}
+    CASE
+        WHEN {{ depth }} < 10 THEN 'Shallow'
+        WHEN {{ depth }} BETWEEN 10 AND 70 THEN 'Intermediate'
+        ELSE 'Deep'
+    END
+{%- endmacro %}
@@ -0,0 +1,9 @@
+{#
+    Integer id of the lat/lon grid cell a point falls in, with cells of
+    var('geo_cell_degrees') on each side. Nearby events share a cell, so
+    clustering on it keeps them in the same micro-partitions.
+#}
+{% macro geo_cell(latitude, longitude) -%}
+    {%- set size = var('geo_cell_degrees') -%}
+    CAST(FLOOR(({{ latitude }} + 90) / {{ size }}) * 1000 + FLOOR(({{ longitude }} + 180) / {{ size }}) AS INTEGER)
+{%- endmacro %}
@@ -0,0 +1,92 @@
+{#
+    Adapter-dispatched building blocks, so the same models run on Snowflake and on the
+    local DuckDB target. default__ implementations are the Snowflake SQL the models
+    used before; duckdb__ ones read the landed GeoJSON through DuckDB's JSON functions.
+#}
+
+{# One row per element of a JSON array column, exposed as <alias>.value #}
+{% macro flatten_json_array(array, alias) -%}
+    {{ return(adapter.dispatch('flatten_json_array')(array, alias)) }}
+{%- endmacro %}
+
+{% macro default__flatten_json_array(array, alias) -%}
+    LATERAL FLATTEN(input => {{ array }}) {{ alias }}
+{%- endmacro %}
+
+{% macro duckdb__flatten_json_array(array, alias) -%}
+    unnest(json_extract({{ array }}, '$[*]')) AS {{ alias }}(value)
+{%- endmacro %}
+
+
+{# A typed value at a dotted path ('geometry.coordinates[0]') inside a JSON value; NULL when missing #}
+{% macro json_get(json, path, type) -%}
+    {{ return(adapter.dispatch('json_get')(json, path, type)) }}
+{%- endmacro %}
+
+{% macro default__json_get(json, path, type) -%}
+    {{ json }}:{{ path }}::{{ type }}
+{%- endmacro %}
+
+{% macro duckdb__json_get(json, path, type) -%}
+    {%- set text = "json_extract_string(" ~ json ~ ", '$." ~ path ~ "')" -%}
+    {%- if type == 'string' -%}
+        {{ text }}
+    {%- elif type == 'float' -%}
+        TRY_CAST({{ text }} AS DOUBLE)
+    {%- elif type in ('integer', 'number') -%}
+        TRY_CAST({{ text }} AS BIGINT)
+    {%- elif type == 'boolean' -%}
+        TRY_CAST(TRY_CAST({{ text }} AS BIGINT) AS BOOLEAN)
+    {%- else -%}
+        {{ exceptions.raise_compiler_error("json_get does not support type " ~ type) }}
+    {%- endif -%}
+{%- endmacro %}
+
+
+{# Timestamp without time zone from epoch milliseconds #}
+{% macro epoch_ms_to_timestamp(epoch_ms) -%}
+    {{ return(adapter.dispatch('epoch_ms_to_timestamp')(epoch_ms)) }}
+{%- endmacro %}
+
+{% macro default__epoch_ms_to_timestamp(epoch_ms) -%}
+    TO_TIMESTAMP_NTZ({{ epoch_ms }}, 3)
+{%- endmacro %}
+
+{% macro duckdb__epoch_ms_to_timestamp(epoch_ms) -%}
+    epoch_ms({{ epoch_ms }})
+{%- endmacro %}
+
+
+{# Engine-native signed 64-bit hash of the given expressions #}
+{% macro row_hash(columns) -%}
+    {{ return(adapter.dispatch('row_hash')(columns)) }}
+{%- endmacro %}
+
+{% macro default__row_hash(columns) -%}
+    HASH({{ columns | join(', ') }})
+{%- endmacro %}
+
+{% macro duckdb__row_hash(columns) -%}
+    {#- DuckDB's hash is unsigned; drop a bit so it fits BIGINT like the landed fingerprints -#}
+    CAST(hash({{ columns | join(', ') }}) >> 1 AS BIGINT)
+{%- endmacro %}
+
+
+{# Strategy for models that upsert by unique_key: MERGE where the adapter has it #}
+{% macro upsert_strategy() -%}
+    {{ return(adapter.dispatch('upsert_strategy')()) }}
+{%- endmacro %}
+
+{% macro default__upsert_strategy() -%}
+    {{ return('merge') }}
+{%- endmacro %}
+
+{% macro duckdb__upsert_strategy() -%}
+    {{ return('delete+insert') }}
+{%- endmacro %}
+
+
+{# Start of the window an incremental model reprocesses: its latest load_timestamp less raw_lookback_minutes #}
+{% macro incremental_lookback() -%}
+    (SELECT {{ dbt.dateadd('minute', -var('raw_lookback_minutes'), 'MAX(load_timestamp)') }} FROM {{ this }})
+{%- endmacro %}
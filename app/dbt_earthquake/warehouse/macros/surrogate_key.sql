@@ -0,0 +1,12 @@
+{#
+    Deterministic key for a row: MD5 of the '|'-joined column values, with NULLs
+    spelled out so (NULL, 'a') and ('', 'a') hash differently. The same inputs give
+    the same key in every run, so dimensions and facts can be merged incrementally.
+#}
+{% macro surrogate_key(columns) -%}
+    MD5(
+    {%- for column in columns %}
+        COALESCE(CAST({{ column }} AS VARCHAR), '_null_'){% if not loop.last %} || '|' ||{% endif %}
+    {%- endfor %}
+    )
+{%- endmacro %}
@@ -0,0 +1,16 @@
+{#
+    Event dates an incremental mart has to recompute: the dates of every event merged
+    into fact_earthquake since the mart last loaded, plus the dates revised events
+    moved out of. Marts keep MAX(load_timestamp) per bucket to mark their last load.
+#}
+{% macro touched_event_dates() -%}
+    SELECT event_date
+    FROM {{ ref('fact_earthquake') }}
+    WHERE load_timestamp >= {{ incremental_lookback() }}
+        AND event_date IS NOT NULL
+    UNION
+    SELECT prior_event_date
+    FROM {{ ref('fact_earthquake') }}
+    WHERE load_timestamp >= {{ incremental_lookback() }}
+        AND prior_event_date IS NOT NULL
+{%- endmacro %}
@@ -1,5 +1,14 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='event_id',
+        incremental_strategy=upsert_strategy()
+    )
+}}
+
+-- stg_dedup_raw holds one row per id, so each event keeps its key as it is revised
 WITH events AS (
-    SELECT DISTINCT
+    SELECT
         id,
         magnitude,
         depth,
@@ -19,13 +28,17 @@ WITH events AS (
         gap,
         mag_type,
         event_type,
-        event_title
+        event_title,
+        load_timestamp
     FROM
         {{ ref('stg_dedup_raw') }}
+    {% if is_incremental() %}
+    WHERE load_timestamp >= {{ incremental_lookback() }}
+    {% endif %}
 )
 
 SELECT
-    ROW_NUMBER() OVER (ORDER BY id) AS event_id,
+    {{ surrogate_key(['id']) }} AS event_id,
     id,
     depth,
     magnitude,
@@ -45,6 +58,7 @@ SELECT
     gap,
     mag_type,
     event_type,
-    event_title
+    event_title,
+    load_timestamp
 FROM
     events
@@ -1,16 +1,52 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='location_id',
+        incremental_strategy=upsert_strategy(),
+        post_hook="DELETE FROM {{ this }} WHERE load_timestamp IS NULL"
+    )
+}}
+
+-- depends_on: {{ ref('fact_earthquake') }}
 WITH locations AS (
-    SELECT DISTINCT
+    SELECT
         longitude,
         latitude,
-        location
+        location,
+        MAX(load_timestamp) AS load_timestamp
     FROM
         {{ ref('stg_dedup_raw') }}
+    {% if is_incremental() %}
+    WHERE load_timestamp >= {{ incremental_lookback() }}
+    {% endif %}
+    GROUP BY
+        longitude,
+        latitude,
+        location
 )
 
 SELECT
-    ROW_NUMBER() OVER (ORDER BY longitude, latitude) AS location_id,
+    {{ surrogate_key(['longitude', 'latitude', 'location']) }} AS location_id,
     longitude,
     latitude,
-    location
+    location,
+    load_timestamp
 FROM
     locations
+{% if is_incremental() %}
+-- Revised events can leave a key behind; keys the fact no longer uses get an empty row so the post-hook drops them
+UNION ALL
+SELECT DISTINCT
+    p.prior_location_id AS location_id,
+    NULL AS longitude,
+    NULL AS latitude,
+    NULL AS location,
+    NULL AS load_timestamp
+FROM
+    {{ ref('fact_earthquake') }} p
+WHERE p.load_timestamp >= {{ incremental_lookback() }}
+    AND p.prior_location_id IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM {{ ref('fact_earthquake') }} f WHERE f.location_id = p.prior_location_id
+    )
+{% endif %}
@@ -1,14 +1,48 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='time_id',
+        incremental_strategy=upsert_strategy(),
+        post_hook="DELETE FROM {{ this }} WHERE load_timestamp IS NULL"
+    )
+}}
+
+-- depends_on: {{ ref('fact_earthquake') }}
 WITH times AS (
-    SELECT DISTINCT
-        event_time::timestamp AS event_timestamp,
-        updated_time::timestamp AS updated_timestamp,
+    SELECT
+        event_time AS event_timestamp,
+        updated_time AS updated_timestamp,
+        MAX(load_timestamp) AS load_timestamp
     FROM
         {{ ref('stg_dedup_raw') }}
+    {% if is_incremental() %}
+    WHERE load_timestamp >= {{ incremental_lookback() }}
+    {% endif %}
+    GROUP BY
+        event_time,
+        updated_time
 )
 
 SELECT
-    ROW_NUMBER() OVER (ORDER BY event_timestamp) AS time_id,
+    {{ surrogate_key(['event_timestamp', 'updated_timestamp']) }} AS time_id,
     event_timestamp,
-    updated_timestamp
+    updated_timestamp,
+    load_timestamp
 FROM
     times
+{% if is_incremental() %}
+-- Revised events can leave a key behind; keys the fact no longer uses get an empty row so the post-hook drops them
+UNION ALL
+SELECT DISTINCT
+    p.prior_time_id AS time_id,
+    NULL AS event_timestamp,
+    NULL AS updated_timestamp,
+    NULL AS load_timestamp
+FROM
+    {{ ref('fact_earthquake') }} p
+WHERE p.load_timestamp >= {{ incremental_lookback() }}
+    AND p.prior_time_id IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM {{ ref('fact_earthquake') }} f WHERE f.time_id = p.prior_time_id
+    )
+{% endif %}
@@ -1,9 +1,21 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='earthquake_id',
+        incremental_strategy=upsert_strategy(),
+        on_schema_change='append_new_columns',
+        cluster_by=['event_date', 'geo_cell']
+    )
+}}
+
+-- Keys are derived from the event's own columns with the same surrogate_key inputs as
+-- the dimensions, so no dimension lookup is needed and revised events merge in place
 SELECT
-    CONCAT(l.location_id,t.time_id, e.event_id) AS earthquake_id,
-    l.location_id,
-    t.time_id,
-    e.event_id,
-    e.depth,
+    {{ surrogate_key(['f.id']) }} AS earthquake_id,
+    {{ surrogate_key(['f.longitude', 'f.latitude', 'f.location']) }} AS location_id,
+    {{ surrogate_key(['f.event_time', 'f.updated_time']) }} AS time_id,
+    {{ surrogate_key(['f.id']) }} AS event_id,
+    f.depth,
     f.magnitude,
     f.felt_reports,
     f.cdi,
@@ -24,17 +36,29 @@ SELECT
     f.load_id,
     f.load_timestamp,
     f.batch_id,
-    t.updated_timestamp,
-    f.event_time
+    f.updated_time AS updated_timestamp,
+    f.event_time,
+    -- Clustering keys: marts filter and group on the event date, spatial queries on the grid cell
+    f.event_time::date AS event_date,
+    {{ geo_cell('f.latitude', 'f.longitude') }} AS geo_cell,
+    -- Event date and dimension keys of the version this row replaced, so incremental marts also recompute the
+    -- day an event moved out of and the dimensions drop keys it left. Rows reprocessed without a new version
+    -- keep the values from the last real revision.
+{% if is_incremental() %}
+    CASE WHEN p.load_id = f.load_id THEN p.prior_event_date ELSE p.event_date END AS prior_event_date,
+    CASE WHEN p.load_id = f.load_id THEN p.prior_location_id ELSE p.location_id END AS prior_location_id,
+    CASE WHEN p.load_id = f.load_id THEN p.prior_time_id ELSE p.time_id END AS prior_time_id
+{% else %}
+    CAST(NULL AS DATE) AS prior_event_date,
+    CAST(NULL AS VARCHAR) AS prior_location_id,
+    CAST(NULL AS VARCHAR) AS prior_time_id
+{% endif %}
 
 
 FROM
     {{ ref('stg_dedup_raw') }} f
-    JOIN {{ ref('dim_location') }} l
-        ON f.longitude = l.longitude
-        AND f.latitude = l.latitude
-        AND f.location = l.location
-    JOIN {{ ref('dim_time') }} t
-        ON f.event_time::timestamp = t.event_timestamp
-    JOIN {{ ref('dim_event') }} e
-        ON f.id = e.id
+{% if is_incremental() %}
+LEFT JOIN {{ this }} p
+    ON p.earthquake_id = {{ surrogate_key(['f.id']) }}
+WHERE f.load_timestamp >= {{ incremental_lookback() }}
+{% endif %}
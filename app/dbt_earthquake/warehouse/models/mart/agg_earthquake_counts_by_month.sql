@@ -1,21 +1,47 @@
-WITH base AS (
+{{
+    config(
+        materialized='incremental',
+        unique_key='month',
+        incremental_strategy='delete+insert',
+        post_hook="DELETE FROM {{ this }} WHERE total_earthquake_count = 0"
+    )
+}}
+
+-- Counted from the fact's event_date clustering key; only months touched since the last load are recomputed
+WITH
+{% if is_incremental() %}
+touched AS (
+    SELECT DISTINCT date_trunc('month', event_date) AS month
+    FROM ({{ touched_event_dates() }}) d
+),
+{% endif %}
+base AS (
     SELECT
-        t.updated_timestamp::date AS date,
-        COUNT(*) AS earthquake_count
+        date_trunc('month', f.event_date) AS month,
+        COUNT(*) AS total_earthquake_count,
+        MAX(f.load_timestamp) AS load_timestamp
     FROM
         {{ ref('fact_earthquake') }} f
-    JOIN {{ ref('dim_time') }} t
-        ON f.time_id = t.time_id
+    {% if is_incremental() %}
+    WHERE f.event_date >= (SELECT MIN(month) FROM touched)
+        AND date_trunc('month', f.event_date) IN (SELECT month FROM touched)
+    {% endif %}
     GROUP BY
-        t.updated_timestamp::date
+        date_trunc('month', f.event_date)
 )
 
 SELECT
-    date_trunc('month', date) AS month,
-    SUM(earthquake_count) AS total_earthquake_count
+    month,
+    total_earthquake_count,
+    load_timestamp
 FROM
     base
-GROUP BY
-    month
+{% if is_incremental() %}
+-- Touched months left without events get an empty row so the delete clears them; the post-hook drops it
+UNION ALL
+SELECT d.month, 0, NULL
+FROM touched d
+WHERE NOT EXISTS (SELECT 1 FROM base WHERE base.month = d.month)
+{% endif %}
 ORDER BY
     month
@@ -0,0 +1,55 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='event_date',
+        incremental_strategy='delete+insert',
+        post_hook="DELETE FROM {{ this }} WHERE total_earthquakes = 0"
+    )
+}}
+
+-- Daily building block for the marts without a time dimension: only the event dates touched
+-- since the last load are recomputed, and those marts roll these rows up instead of scanning the fact
+WITH
+{% if is_incremental() %}
+touched AS (
+    {{ touched_event_dates() }}
+),
+{% endif %}
+daily AS (
+    SELECT
+        f.event_date,
+        f.location_id,
+        l.location,
+        {{ depth_range('COALESCE(f.depth, 0)') }} AS depth_range,
+        f.event_type,
+        f.alert_level,
+        COUNT(*) AS total_earthquakes,
+        SUM(CASE WHEN f.tsunami THEN 1 ELSE 0 END) AS tsunami_count,
+        SUM(COALESCE(f.magnitude, 0)) AS magnitude_sum,
+        MAX(f.load_timestamp) AS load_timestamp
+    FROM
+        {{ ref('fact_earthquake') }} f
+    JOIN {{ ref('dim_location') }} l
+        ON f.location_id = l.location_id
+    {% if is_incremental() %}
+    WHERE f.event_date >= (SELECT MIN(event_date) FROM touched)
+        AND f.event_date IN (SELECT event_date FROM touched)
+    {% endif %}
+    GROUP BY
+        f.event_date,
+        f.location_id,
+        l.location,
+        {{ depth_range('COALESCE(f.depth, 0)') }},
+        f.event_type,
+        f.alert_level
+)
+
+SELECT *
+FROM daily
+{% if is_incremental() %}
+-- Touched dates left without events get an empty row so the delete clears them; the post-hook drops it
+UNION ALL
+SELECT d.event_date, NULL, NULL, NULL, NULL, NULL, 0, 0, 0, NULL
+FROM touched d
+WHERE NOT EXISTS (SELECT 1 FROM daily WHERE daily.event_date = d.event_date)
+{% endif %}
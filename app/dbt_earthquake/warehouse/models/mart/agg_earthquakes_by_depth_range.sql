@@ -1,20 +1,9 @@
-WITH depth_ranges AS (
-    SELECT
-        COALESCE(depth, 0) AS depth,
-        CASE
-            WHEN depth < 10 THEN 'Shallow'
-            WHEN depth BETWEEN 10 AND 70 THEN 'Intermediate'
-            ELSE 'Deep'
-        END AS depth_range
-    FROM
-        {{ ref('fact_earthquake') }}
-)
-
+-- Rolled up from the incrementally maintained daily summary instead of the full fact
 SELECT
     depth_range,
-    COUNT(*) AS num_earthquakes
+    SUM(total_earthquakes) AS num_earthquakes
 FROM
-    depth_ranges
+    {{ ref('agg_earthquakes_by_day') }}
 GROUP BY
     depth_range
 ORDER BY
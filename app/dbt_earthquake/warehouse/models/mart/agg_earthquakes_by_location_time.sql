@@ -1,18 +1,41 @@
-WITH monthly_earthquakes AS (
+{{
+    config(
+        materialized='incremental',
+        unique_key='event_date',
+        incremental_strategy='delete+insert',
+        post_hook="DELETE FROM {{ this }} WHERE total_earthquakes = 0"
+    )
+}}
+
+-- Rebuilt one event date at a time: only the dates touched since the last load are recomputed
+WITH
+{% if is_incremental() %}
+touched AS (
+    {{ touched_event_dates() }}
+),
+{% endif %}
+monthly_earthquakes AS (
     SELECT
         l.location_id,
         t.time_id,
+        f.event_date,
         COUNT(*) AS total_earthquakes,
-        AVG(COALESCE(TRY_CAST(f.magnitude AS NUMBER), 0)) AS avg_magnitude
+        AVG(COALESCE(f.magnitude, 0)) AS avg_magnitude,
+        MAX(f.load_timestamp) AS load_timestamp
     FROM
         {{ ref('fact_earthquake') }} f
     JOIN {{ ref('dim_location') }} l
         ON f.location_id = l.location_id
     JOIN {{ ref('dim_time') }} t
-        ON f.event_time::timestamp = t.event_timestamp
+        ON f.time_id = t.time_id
+    {% if is_incremental() %}
+    WHERE f.event_date >= (SELECT MIN(event_date) FROM touched)
+        AND f.event_date IN (SELECT event_date FROM touched)
+    {% endif %}
     GROUP BY
         l.location_id,
-        t.time_id
+        t.time_id,
+        f.event_date
 )
 
 SELECT
@@ -20,11 +43,20 @@ SELECT
     l.location,
     t.time_id,
     t.event_timestamp AS month,
+    m.event_date,
     m.total_earthquakes,
-    m.avg_magnitude
+    m.avg_magnitude,
+    m.load_timestamp
 FROM
     monthly_earthquakes m
 JOIN {{ ref('dim_location') }} l
     ON m.location_id = l.location_id
 JOIN {{ ref('dim_time') }} t
     ON m.time_id = t.time_id
+{% if is_incremental() %}
+-- Touched dates left without events get an empty row so the delete clears them; the post-hook drops it
+UNION ALL
+SELECT NULL, NULL, NULL, NULL, d.event_date, 0, NULL, NULL
+FROM touched d
+WHERE NOT EXISTS (SELECT 1 FROM monthly_earthquakes m WHERE m.event_date = d.event_date)
+{% endif %}
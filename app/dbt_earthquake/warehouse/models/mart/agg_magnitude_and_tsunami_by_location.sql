@@ -1,14 +1,13 @@
+-- Rolled up from the incrementally maintained daily summary instead of the full fact
 SELECT
-    l.location_id,
-    l.location,
-    SUM(f.tsunami) AS tsunami_count,
-    AVG(COALESCE(TRY_CAST(f.magnitude AS NUMBER), 0)) AS avg_magnitude
+    d.location_id,
+    d.location,
+    SUM(d.tsunami_count) AS tsunami_count,
+    SUM(d.magnitude_sum) / SUM(d.total_earthquakes) AS avg_magnitude
 FROM
-    EARTHQUAKE.DBT.FACT_EARTHQUAKE f
-JOIN EARTHQUAKE.DBT.DIM_LOCATION l
-    ON f.location_id = l.location_id
+    {{ ref('agg_earthquakes_by_day') }} d
 GROUP BY
-    l.location_id,
-    l.location
+    d.location_id,
+    d.location
 ORDER BY
-    avg_magnitude DESC
\ No newline at end of file
+    avg_magnitude DESC
@@ -1,11 +1,12 @@
+-- Rolled up from the incrementally maintained daily summary instead of the full fact
 SELECT
-    f.event_type,
-    COUNT(*) AS total_alerts
+    d.event_type,
+    SUM(d.total_earthquakes) AS total_alerts
 FROM
-    {{ ref('fact_earthquake') }} f
+    {{ ref('agg_earthquakes_by_day') }} d
 WHERE
-    f.alert_level IS NOT NULL
+    d.alert_level IS NOT NULL
 GROUP BY
-    f.event_type
+    d.event_type
 ORDER BY
     total_alerts DESC
@@ -1,9 +1,10 @@
+-- Rolled up from the incrementally maintained daily summary instead of the full fact
 SELECT
-    f.alert_level,
-    COUNT(*) AS total_earthquakes
+    d.alert_level,
+    SUM(d.total_earthquakes) AS total_earthquakes
 FROM
-    {{ ref('fact_earthquake') }} f
+    {{ ref('agg_earthquakes_by_day') }} d
 GROUP BY
-    f.alert_level
+    d.alert_level
 ORDER BY
     total_earthquakes DESC
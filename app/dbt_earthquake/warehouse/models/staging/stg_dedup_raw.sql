@@ -1,16 +1,39 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='id',
+        incremental_strategy=upsert_strategy()
+    )
+}}
+
 WITH flatten AS (
 SELECT *
 FROM {{ ref('stg_flatten_raw') }}
+WHERE id IS NOT NULL AND id != ''
+{% if is_incremental() %}
+    AND load_timestamp >= {{ incremental_lookback() }}
+{% endif %}
+)
+
+, candidates AS (
+SELECT *
+FROM flatten
+{% if is_incremental() %}
+-- Current versions of the touched events compete with the new rows, so a late-arriving older version never wins
+UNION ALL
+SELECT * EXCLUDE (rn)
+FROM {{ this }}
+WHERE id IN (SELECT id FROM flatten)
+{% endif %}
 )
 
 , dedup AS (
 SELECT 
     *,
-    ROW_NUMBER() OVER (PARTITION BY id ORDER BY updated_time DESC) AS rn
-FROM flatten
-WHERE id IS NOT NULL AND id != ''
+    ROW_NUMBER() OVER (PARTITION BY id ORDER BY updated_time DESC, load_timestamp DESC) AS rn
+FROM candidates
 )
 
 SELECT *
 FROM dedup
-where rn = 1
\ No newline at end of file
+where rn = 1
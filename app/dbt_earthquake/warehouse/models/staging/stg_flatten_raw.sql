@@ -1,3 +1,11 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='load_id',
+        incremental_strategy=upsert_strategy()
+    )
+}}
+
 WITH base AS (
     SELECT
         _AIRBYTE_RAW_ID AS batch_id,  
@@ -5,69 +13,54 @@ WITH base AS (
         features
     FROM
         {{ source('earthquake', 'earthquake_data_raw') }}
+    {% if is_incremental() %}
+    -- Only raw rows extracted since the last run, looking back a little for rows a running sync committed late
+    WHERE _AIRBYTE_EXTRACTED_AT >= {{ incremental_lookback() }}
+    {% endif %}
 ),
 
--- Flatten the array of JSON objects
+-- Flatten the array of JSON objects into typed columns; missing properties stay NULL
 flattened_features AS (
     SELECT
         base.batch_id,                                  
         base.load_timestamp,                          
-        COALESCE(f.value:geometry:coordinates[0]::string, 'NULL') AS longitude, 
-        COALESCE(f.value:geometry:coordinates[1]::string, 'NULL') AS latitude,   
-        COALESCE(f.value:geometry:coordinates[2]::string, 'NULL') AS depth,      
-        COALESCE(f.value:id::string, 'NULL') AS id,                             
-        COALESCE(f.value:properties:mag::string, 'NULL') AS magnitude,           
-        COALESCE(f.value:properties:place::string, 'NULL') AS location,       
-        COALESCE(TO_TIMESTAMP_NTZ(f.value:properties:time::number / 1000)::string, 'NULL') AS event_time,  
-        COALESCE(TO_TIMESTAMP_NTZ(f.value:properties:updated::number / 1000)::string, 'NULL') AS updated_time,  
-        COALESCE(f.value:properties:url::string, 'NULL') AS event_url,         
-        COALESCE(f.value:properties:felt::string, 'NULL') AS felt_reports,     
-        COALESCE(f.value:properties:cdi::string, 'NULL') AS cdi,                
-        COALESCE(f.value:properties:mmi::string, 'NULL') AS mmi,                 
-        COALESCE(f.value:properties:alert::string, 'NULL') AS alert_level,      
-        COALESCE(f.value:properties:status::string, 'NULL') AS status,        
-        COALESCE(f.value:properties:tsunami::string, 'NULL') AS tsunami,      
-        COALESCE(f.value:properties:sig::string, 'NULL') AS significance,      
-        COALESCE(f.value:properties:net::string, 'NULL') AS network,           
-        COALESCE(f.value:properties:code::string, 'NULL') AS code,              
-        COALESCE(f.value:properties:nst::string, 'NULL') AS num_stations,       
-        COALESCE(f.value:properties:dmin::string, 'NULL') AS min_distance,      
-        COALESCE(f.value:properties:rms::string, 'NULL') AS rms,                
-        COALESCE(f.value:properties:gap::string, 'NULL') AS gap,                
-        COALESCE(f.value:properties:magType::string, 'NULL') AS mag_type,       
-        COALESCE(f.value:properties:type::string, 'NULL') AS event_type,        
-        COALESCE(f.value:properties:title::string, 'NULL') AS event_title,      
-        MD5(
-            COALESCE(longitude, 'NULL') || '|' ||
-            COALESCE(latitude, 'NULL') || '|' ||
-            COALESCE(depth, 'NULL') || '|' ||
-            COALESCE(id, 'NULL') || '|' ||
-            COALESCE(magnitude, 'NULL') || '|' ||
-            COALESCE(location, 'NULL') || '|' ||
-            COALESCE(event_time, 'NULL') || '|' ||
-            COALESCE(event_url, 'NULL') || '|' ||
-            COALESCE(felt_reports, 'NULL') || '|' ||
-            COALESCE(cdi, 'NULL') || '|' ||
-            COALESCE(mmi, 'NULL') || '|' ||
-            COALESCE(alert_level, 'NULL') || '|' ||
-            COALESCE(status, 'NULL') || '|' ||
-            COALESCE(tsunami, 'NULL') || '|' ||
-            COALESCE(significance, 'NULL') || '|' ||
-            COALESCE(network, 'NULL') || '|' ||
-            COALESCE(code, 'NULL') || '|' ||
-            COALESCE(num_stations, 'NULL') || '|' ||
-            COALESCE(min_distance, 'NULL') || '|' ||
-            COALESCE(rms, 'NULL') || '|' ||
-            COALESCE(gap, 'NULL') || '|' ||
-            COALESCE(mag_type, 'NULL') || '|' ||
-            COALESCE(event_type, 'NULL') || '|' ||
-            COALESCE(event_title, 'NULL')
+        {{ json_get('f.value', 'geometry.coordinates[0]', 'float') }} AS longitude, 
+        {{ json_get('f.value', 'geometry.coordinates[1]', 'float') }} AS latitude,   
+        {{ json_get('f.value', 'geometry.coordinates[2]', 'float') }} AS depth,      
+        {{ json_get('f.value', 'id', 'string') }} AS id,                             
+        {{ json_get('f.value', 'properties.mag', 'float') }} AS magnitude,           
+        {{ json_get('f.value', 'properties.place', 'string') }} AS location,       
+        {{ epoch_ms_to_timestamp(json_get('f.value', 'properties.time', 'number')) }} AS event_time,  
+        {{ epoch_ms_to_timestamp(json_get('f.value', 'properties.updated', 'number')) }} AS updated_time,  
+        {{ json_get('f.value', 'properties.url', 'string') }} AS event_url,         
+        {{ json_get('f.value', 'properties.felt', 'integer') }} AS felt_reports,     
+        {{ json_get('f.value', 'properties.cdi', 'float') }} AS cdi,                
+        {{ json_get('f.value', 'properties.mmi', 'float') }} AS mmi,                 
+        {{ json_get('f.value', 'properties.alert', 'string') }} AS alert_level,      
+        {{ json_get('f.value', 'properties.status', 'string') }} AS status,        
+        {{ json_get('f.value', 'properties.tsunami', 'boolean') }} AS tsunami,      
+        {{ json_get('f.value', 'properties.sig', 'integer') }} AS significance,      
+        {{ json_get('f.value', 'properties.net', 'string') }} AS network,           
+        {{ json_get('f.value', 'properties.code', 'string') }} AS code,              
+        {{ json_get('f.value', 'properties.nst', 'integer') }} AS num_stations,       
+        {{ json_get('f.value', 'properties.dmin', 'float') }} AS min_distance,      
+        {{ json_get('f.value', 'properties.rms', 'float') }} AS rms,                
+        {{ json_get('f.value', 'properties.gap', 'float') }} AS gap,                
+        {{ json_get('f.value', 'properties.magType', 'string') }} AS mag_type,       
+        {{ json_get('f.value', 'properties.type', 'string') }} AS event_type,        
+        {{ json_get('f.value', 'properties.title', 'string') }} AS event_title,      
+        -- 64-bit fingerprint of id and updated time stamped at landing; payloads landed before it existed hash the same inputs here
+        COALESCE(
+            {{ json_get('f.value', 'fingerprint', 'number') }},
+            {{ row_hash([json_get('f.value', 'id', 'string'), json_get('f.value', 'properties.updated', 'number')]) }}
         ) AS load_id
     FROM
         base,
-        LATERAL FLATTEN(input => base.features) f
+        {{ flatten_json_array('base.features', 'f') }}
 )
 
+-- Overlapping polls land the same event version more than once; keep one row per version so the merge key is unique
 SELECT
     *
 FROM flattened_features
+QUALIFY ROW_NUMBER() OVER (PARTITION BY load_id ORDER BY load_timestamp DESC) = 1
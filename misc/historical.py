@@ -3,13 +3,18 @@ import json
 import logging
 import os
 import pytz
-import requests
-import boto3
 from dotenv import load_dotenv
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
 import time
-import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dateutil.relativedelta import relativedelta
+from project.connectors.usgs_client import USGSClient
+from project.connectors.s3_client import S3Client
+from project.connectors.airbyte_client import AirbyteClient
+from project.connectors.geojson_stream import encode_feature_collection
+from project.connectors.parquet_landing import ParquetLander
+from earthquake_common.fingerprint import stamp_fingerprints
+from project.connectors.sync_coalescer import SyncCoalescer
 
 # Load environment variables
 load_dotenv()
@@ -18,200 +23,177 @@ load_dotenv()
 USGS_URL = os.environ.get('USGS_URL')
 S3_BUCKET = os.environ.get('S3_BUCKET')
 AWS_REGION = os.environ.get('AWS_REGION')
+S3_COMPRESSION = os.environ.get('S3_COMPRESSION') or None
+PARQUET_LANDING_PATH = os.environ.get('PARQUET_LANDING_PATH')
 AIRBYTE_SERVER_NAME = os.environ.get('AIRBYTE_SERVER_NAME')
 AIRBYTE_CONNECTION_ID = os.environ.get('AIRBYTE_CONNECTION_ID')
+AIRBYTE_SYNC_TIMEOUT = int(os.environ.get('AIRBYTE_SYNC_TIMEOUT', 3600))
+BACKFILL_JOURNAL = os.environ.get('BACKFILL_JOURNAL', 'backfill_journal.jsonl')
+BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', 4))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class USGSClient:
-    def __init__(self, url):
-        self.url = url
-
-    def fetch_data(self, start_time_str, end_time_str):
-        try:
-            params = {
-                'format': 'geojson',
-                'start': start_time_str,
-                'end': end_time_str,
-            }
-            logger.info(f"Requesting data from USGS API with parameters: {params}")
-            response = requests.get(self.url, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            logger.error(f"Failed to fetch data from USGS API: {e}")
-            raise
-
-class S3Client:
-    def __init__(self, bucket_name, region_name):
-        self.s3_client = boto3.client('s3', region_name=region_name)
-        self.bucket_name = bucket_name
-
-    def upload_to_s3(self, data, s3_key):
-        try:
-            self.s3_client.put_object(Bucket=self.bucket_name, Key=s3_key, Body=json.dumps(data))
-            logger.info(f"Data successfully uploaded to s3://{self.bucket_name}/{s3_key}")
-        except (NoCredentialsError, PartialCredentialsError) as e:
-            logger.error(f"Credentials error while accessing S3: {e}")
-            raise
-        except ClientError as e:
-            logger.error(f"Client error while uploading to S3: {e}")
-            raise
-
-class AirbyteClient:
-    def __init__(self, server_name: str, username: str, password: str):
-        self.server_name = server_name
-        self.username = username
-        self.password = password
-        self.token = base64.b64encode(
-            f"{self.username}:{self.password}".encode()
-        ).decode()
-        self.headers = {"Authorization": f"Basic {self.token}"}
-        logging.basicConfig(level=logging.INFO)
-
-    def valid_connection(self) -> bool:
-        """Check if connection is valid"""
-        url = f"http://{self.server_name}:8001/api/public/v1/health"
-        logging.info(f"Checking Airbyte server health at {url}")
-
-        try:
-            response = requests.get(url=url, headers=self.headers)
-            if response.status_code == 200:
-                logging.info("Airbyte connection is valid.")
-                return True
-            else:
-                logging.error(f"Airbyte connection is not valid. Status code: {response.status_code}. Error message: {response.text}")
-                raise Exception(
-                    f"Airbyte connection is not valid. Status code: {response.status_code}. Error message: {response.text}"
+class BackfillEngine:
+    """Backfills the USGS catalog in parallel, resumable chunks.
+
+    Each month is sized with the FDSN count endpoint and split in half until every
+    chunk is under the result cap, then chunks are fetched by a bounded worker pool.
+    Finished chunks are appended to a journal so a restart skips them.
+    """
+
+    def __init__(self, usgs_client, s3_client, journal_path, max_workers=4, max_results=None,
+                 min_window=datetime.timedelta(minutes=1), max_attempts=3, parquet_lander=None):
+        self.usgs_client = usgs_client
+        self.s3_client = s3_client
+        self.parquet_lander = parquet_lander
+        self.journal_path = journal_path
+        self.max_workers = max_workers
+        self.max_results = max_results
+        self.min_window = min_window
+        self.max_attempts = max_attempts
+        self.journal_lock = threading.Lock()
+
+    @staticmethod
+    def chunk_key(start_time, end_time):
+        return f"earthquake_data_{start_time.strftime('%Y%m%dT%H%M%S')}_{end_time.strftime('%Y%m%dT%H%M%S')}.json"
+
+    def load_journal(self):
+        """Return the keys of chunks that finished in a previous run"""
+        if not os.path.exists(self.journal_path):
+            return set()
+        completed = set()
+        with open(self.journal_path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    completed.add(json.loads(line)['key'])
+        return completed
+
+    def record_chunk(self, key, start_time, end_time, count):
+        entry = {
+            'key': key,
+            'start': format_time(start_time),
+            'end': format_time(end_time),
+            'count': count,
+        }
+        with self.journal_lock:
+            with open(self.journal_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def split_window(self, start_time, end_time):
+        """Split a window until every chunk is under the USGS result cap"""
+        count, max_allowed = self.usgs_client.count(format_time(start_time), format_time(end_time))
+        limit = self.max_results or max_allowed
+        if count <= limit:
+            return [(start_time, end_time, count)]
+        if end_time - start_time <= self.min_window:
+            raise Exception(f"Window {format_time(start_time)} to {format_time(end_time)} has {count} events and cannot be split further")
+
+        midpoint = start_time + (end_time - start_time) / 2
+        logger.info(f"{count} events between {format_time(start_time)} and {format_time(end_time)} exceeds {limit}, splitting at {format_time(midpoint)}")
+        return self.split_window(start_time, midpoint) + self.split_window(midpoint, end_time)
+
+    def plan(self, start_date, end_date):
+        """Size every month concurrently and return the chunks to fetch, oldest first"""
+        months = []
+        current_date = start_date
+        while current_date < end_date:
+            next_date = min((current_date + relativedelta(months=1)).replace(day=1), end_date)
+            months.append((current_date, next_date))
+            current_date = next_date
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            planned = executor.map(lambda window: self.split_window(*window), months)
+            return [chunk for chunks in planned for chunk in chunks]
+
+    def fetch_chunk(self, start_time, end_time, count):
+        key = self.chunk_key(start_time, end_time)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                # Stream features straight from the response into S3 so a large chunk is never held in memory
+                stream = self.usgs_client.stream_features(format_time(start_time), format_time(end_time))
+                features = stamp_fingerprints(stream)
+                if self.parquet_lander:
+                    features = self.parquet_lander.tap(features, batch_id=key.split('.')[0])
+                self.s3_client.upload_stream(
+                    encode_feature_collection(stream, features=features),
+                    key,
+                    partition_date=start_time.date(),
+                    feature_stream=stream,
                 )
-        except requests.RequestException as e:
-            logging.error(f"Exception occurred during health check: {str(e)}")
-            raise Exception(f"Exception occurred during health check: {str(e)}")
-
-    def trigger_sync(self, connection_id: str):
-        """Trigger sync for a connection_id"""
-        url = f"http://{self.server_name}:8001/api/public/v1/jobs"
-        
-        def check_job_status(job_id: str):
-            job_status_url = f"http://{self.server_name}:8001/api/public/v1/jobs/{job_id}"
-            job_response = requests.get(url=job_status_url, headers=self.headers)
-            if job_response.status_code == 200:
-                job_data = job_response.json()
-                return job_data.get("status")
-            else:
-                logging.error(f"Failed to get job status. Status code: {job_response.status_code}. Error message: {job_response.text}")
-                raise Exception(f"Failed to get job status. Status code: {job_response.status_code}. Error message: {response.text}")
-
-        try:
-            data = {"connectionId": connection_id, "jobType": "sync"}
-            logging.info(f"Triggering Airbyte sync job with connection ID: {connection_id} at {url}")
-            response = requests.post(url=url, json=data, headers=self.headers)
-            if response.status_code != 200:
-                logging.error(f"Failed to trigger sync. Status code: {response.status_code}. Error message: {response.text}")
-                raise Exception(f"Failed to trigger sync. Status code: {response.status_code}. Error message: {response.text}")
-
-            job_id = response.json().get("jobId")
-            if not job_id:
-                logging.error(f"No jobId returned in response. Response: {response.text}")
-                raise Exception(f"No jobId returned in response. Response: {response.text}")
-
-            logging.info(f"Sync job triggered successfully. Job ID: {job_id}")
-
-            while True:
-                sleep_seconds = 5
-                logging.info(f"Job {job_id} is running. Checking job status again in {sleep_seconds} seconds.")
-                time.sleep(sleep_seconds)
-
-                job_status = check_job_status(job_id)
-                
-                if job_status == "failed":
-                    logging.error(f"Job {job_id} has failed.")
-                    raise Exception(f"Job {job_id} has failed.")
-                elif job_status == "succeeded":
-                    logging.info(f"Job {job_id} has succeeded.")
-                    return  # Successfully completed
-
-        except requests.RequestException as e:
-            logging.error(f"Exception occurred while triggering sync job: {str(e)}")
-            raise Exception(f"Exception occurred while triggering sync job: {str(e)}")
+                self.record_chunk(key, start_time, end_time, stream.count)
+                logger.info(f"Chunk {key} uploaded successfully ({count} events).")
+                return key
+            except Exception as e:
+                logger.warning(f"Chunk {key} failed on attempt {attempt} of {self.max_attempts}: {e}")
+                if attempt == self.max_attempts:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def run(self, start_date, end_date):
+        completed = self.load_journal()
+        chunks = [
+            chunk for chunk in self.plan(start_date, end_date)
+            if self.chunk_key(chunk[0], chunk[1]) not in completed
+        ]
+        logger.info(f"{len(chunks)} chunks to backfill, {len(completed)} already completed.")
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch_chunk, *chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                start_time, end_time, _ = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Giving up on {format_time(start_time)} to {format_time(end_time)}: {e}")
+                    failed.append(futures[future])
+
+        if failed:
+            # Failed chunks are not journaled, so rerunning the backfill picks them up
+            raise Exception(f"{len(failed)} of {len(chunks)} chunks failed, rerun to resume the backfill")
+        return len(chunks)
+
+
+def format_time(timestamp):
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S')
+
 
 def main():
-    # Initialize clients
-    usgs_client = USGSClient(USGS_URL)
-    s3_client = S3Client(S3_BUCKET, AWS_REGION)
+    # Standalone backfill for running without Dagster; under Dagster, backfill the daily-partitioned
+    # usgs assets instead, which fan out one run per day through the run queue
+    # Initialize clients, with enough pooled connections for every worker
+    usgs_client = USGSClient(USGS_URL, pool_maxsize=BACKFILL_WORKERS)
+    s3_client = S3Client(S3_BUCKET, AWS_REGION, compression=S3_COMPRESSION)
     airbyte_client = AirbyteClient(
         server_name=AIRBYTE_SERVER_NAME,
         username=os.environ.get('AIRBYTE_USERNAME'),
         password=os.environ.get('AIRBYTE_PASSWORD')
     )
+    engine = BackfillEngine(
+        usgs_client,
+        s3_client,
+        journal_path=BACKFILL_JOURNAL,
+        max_workers=BACKFILL_WORKERS,
+        parquet_lander=ParquetLander(PARQUET_LANDING_PATH, AWS_REGION) if PARQUET_LANDING_PATH else None,
+    )
 
     # Start from January 2020
-    current_date = datetime.datetime(2020, 1, 1, tzinfo=pytz.UTC)
+    start_date = datetime.datetime(2020, 1, 1, tzinfo=pytz.UTC)
     end_date = datetime.datetime.now(tz=pytz.UTC)
 
-    while current_date < end_date:
-        # Calculate the start and end times for the period
-        start_time = current_date
-        end_time = (start_time + relativedelta(months=1)).replace(day=1)  # Move to the start of the next month
-
-        # Convert to EST
-        est = pytz.timezone('US/Eastern')
-        start_time_est = start_time.astimezone(est)
-        end_time_est = end_time.astimezone(est)
-
-        # Format dates for request
-        start_time_str = start_time_est.strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
-        end_time_str = end_time_est.strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
+    chunk_count = engine.run(start_date, end_date)
 
-        logger.info(f"Start time: {start_time_str}, End time: {end_time_str}")
-
-        # Format filename with timestamp in EST
-        timestamp = start_time_est.strftime('%Y-%m')
-        filename = f"earthquake_data_{timestamp}.json"
-
-        # Try fetching data and uploading to S3
-        data_fetched = False
-        retry_interval = 5  # Time to wait before retrying in seconds
-
-        for attempt in range(3):  # Try up to 3 times before skipping
-            try:
-                data = usgs_client.fetch_data(start_time_str, end_time_str)
-                s3_client.upload_to_s3(data, filename)
-                logger.info(f"Data for {timestamp} uploaded successfully.")
-                data_fetched = True
-                break  # Exit loop on successful fetch and upload
-
-            except requests.HTTPError as e:
-                if e.response.status_code == 400:
-                    logger.warning(f"Received 400 Bad Request error. Attempt {attempt + 1} of 3.")
-                    # Retry with a 15-day period if 400 error is encountered
-                    end_time = start_time + datetime.timedelta(days=15)
-                    end_time = min(end_time, end_date)  # Ensure we do not exceed the overall end date
-                    end_time_str = end_time.astimezone(est).strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
-                    logger.info(f"Retrying with new end time: {end_time_str}")
-                    time.sleep(retry_interval)  # Wait before retrying
-                else:
-                    logger.error(f"HTTP error occurred: {e}")
-                    break
-
-            except Exception as e:
-                logger.error(f"An error occurred for {timestamp}: {e}")
-                break
-
-        if not data_fetched:
-            logger.warning(f"Skipping time frame: {start_time_str} to {end_time_str}")
-        
-        # Trigger Airbyte sync
-        try:
-            airbyte_client.trigger_sync(connection_id=AIRBYTE_CONNECTION_ID)
-            logger.info(f"Airbyte sync triggered successfully for {timestamp} data.")
-        except Exception as e:
-            logger.error(f"Failed to trigger Airbyte sync for {timestamp}: {e}")
-
-        # Move to the next month
-        current_date = end_time
+    # One Airbyte sync covers every backfilled chunk, after any sync already running for the connection
+    if chunk_count:
+        sync_coalescer = SyncCoalescer(airbyte_client, AIRBYTE_CONNECTION_ID)
+        sync_coalescer.notify_landed(chunk_count)
+        status = sync_coalescer.flush(timeout=AIRBYTE_SYNC_TIMEOUT)
+        if status != "succeeded":
+            raise Exception(f"Airbyte sync {status} for {chunk_count} backfilled chunks.")
+        logger.info(f"Airbyte sync completed successfully for {chunk_count} backfilled chunks.")
 
 
 
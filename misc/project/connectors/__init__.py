@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The watermark, cache, fingerprint, metrics and landing helpers are shared with the Dagster
+# code location, which ships them as `earthquake_common`; an installed copy takes precedence
+SHARED_PACKAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'app', 'dagster_elt'))
+if SHARED_PACKAGE_DIR not in sys.path:
+    sys.path.append(SHARED_PACKAGE_DIR)
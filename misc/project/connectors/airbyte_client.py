@@ -1,8 +1,12 @@
+import asyncio
 import time
 import requests
 import base64
 import logging
 
+# Job statuses after which Airbyte will not touch the job again
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+
 
 class AirbyteClient:
     def __init__(self, server_name: str, username: str, password: str):
@@ -44,7 +48,7 @@ class AirbyteClient:
             return job_data.get("status")
         else:
             logging.error(f"Failed to get job status. Status code: {job_response.status_code}. Error message: {job_response.text}")
-            raise Exception(f"Failed to get job status. Status code: {job_response.status_code}. Error message: {response.text}")
+            raise Exception(f"Failed to get job status. Status code: {job_response.status_code}. Error message: {job_response.text}")
 
     def trigger_sync(self, connection_id: str):
         """Trigger sync for a connection_id"""
@@ -73,3 +77,56 @@ class AirbyteClient:
         except requests.RequestException as e:
             logging.error(f"Exception occurred while triggering sync job: {str(e)}")
             raise Exception(f"Exception occurred while triggering sync job: {str(e)}")
+
+    def cancel_job(self, job_id: str):
+        """Cancel a running job"""
+        url = f"http://{self.server_name}:8001/api/public/v1/jobs/{job_id}"
+        logging.info(f"Cancelling Airbyte job {job_id}")
+        response = requests.delete(url=url, headers=self.headers)
+        if response.status_code != 200:
+            logging.error(f"Failed to cancel job. Status code: {response.status_code}. Error message: {response.text}")
+            raise Exception(f"Failed to cancel job. Status code: {response.status_code}. Error message: {response.text}")
+
+    def next_poll(self, job_id: str, status: str, started: float, interval: float, timeout: float, max_interval: float):
+        """Return the next poll interval, cancelling the job once it runs past the timeout"""
+        if time.monotonic() - started > timeout:
+            logging.error(f"Job {job_id} is still {status} after {timeout} seconds.")
+            self.cancel_job(job_id)
+            raise Exception(f"Job {job_id} timed out after {timeout} seconds and was cancelled.")
+        logging.info(f"Job {job_id} is {status}. Checking job status again in {interval:.0f} seconds.")
+        return min(interval * 2, max_interval)
+
+    def wait_for_job(self, job_id: str, timeout: float = 3600, initial_interval: float = 2, max_interval: float = 60):
+        """Block until the job finishes, polling with exponential backoff"""
+        started = time.monotonic()
+        interval = initial_interval
+        while True:
+            status = self.check_job_status(job_id)
+            if status in TERMINAL_STATUSES:
+                return status
+            next_interval = self.next_poll(job_id, status, started, interval, timeout, max_interval)
+            time.sleep(interval)
+            interval = next_interval
+
+    async def wait_for_job_async(self, job_id: str, timeout: float = 3600, initial_interval: float = 2, max_interval: float = 60):
+        """Asyncio version of wait_for_job; status checks run in a thread so the event loop stays free"""
+        started = time.monotonic()
+        interval = initial_interval
+        while True:
+            status = await asyncio.to_thread(self.check_job_status, job_id)
+            if status in TERMINAL_STATUSES:
+                return status
+            next_interval = await asyncio.to_thread(self.next_poll, job_id, status, started, interval, timeout, max_interval)
+            await asyncio.sleep(interval)
+            interval = next_interval
+
+    def latest_job(self, connection_id: str):
+        """Most recent sync job for a connection, or None if it has never synced"""
+        url = f"http://{self.server_name}:8001/api/public/v1/jobs"
+        params = {"connectionId": connection_id, "jobType": "sync", "limit": 1, "orderBy": "createdAt|DESC"}
+        response = requests.get(url=url, params=params, headers=self.headers)
+        if response.status_code != 200:
+            logging.error(f"Failed to list jobs. Status code: {response.status_code}. Error message: {response.text}")
+            raise Exception(f"Failed to list jobs. Status code: {response.status_code}. Error message: {response.text}")
+        jobs = response.json().get("data", [])
+        return jobs[0] if jobs else None
@@ -0,0 +1,149 @@
+import codecs
+import io
+import itertools
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FEATURES_MARKER = '"features"'
+
+
+class FeatureStream:
+    """Iterates the features of a GeoJSON FeatureCollection from a stream of byte chunks.
+
+    Only the current feature and the unparsed tail of the last chunk are held in memory.
+    `metadata` is filled in from the document header before the first feature is yielded,
+    and `count`, `max_updated` and the `min_time`/`max_time` event times are kept up to
+    date as features are consumed.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+        self.exhausted = False
+        self.metadata = {}
+        self.count = 0
+        self.max_updated = None
+        self.min_time = None
+        self.max_time = None
+
+    def read_more(self) -> bool:
+        """Append the next chunk to the buffer, dropping text that has already been parsed"""
+        if self.exhausted:
+            return False
+        self.buffer = self.buffer[self.position:]
+        self.position = 0
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            self.buffer += self.text_decoder.decode(b'', final=True)
+            return False
+        self.buffer += self.text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        return True
+
+    def skip(self, characters):
+        """Advance past whitespace and the given separator characters, returning the next character"""
+        while True:
+            while self.position < len(self.buffer) and (self.buffer[self.position].isspace() or self.buffer[self.position] in characters):
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read_more():
+                return None
+
+    def read_header(self):
+        """Consume everything up to the opening bracket of the features array"""
+        while True:
+            marker = self.buffer.find(FEATURES_MARKER, self.position)
+            bracket = self.buffer.find('[', marker) if marker != -1 else -1
+            if bracket != -1:
+                break
+            # Keep the buffer unparsed until the whole header has arrived
+            if not self.read_more():
+                raise ValueError("GeoJSON response has no features array")
+        header = self.buffer[self.position:marker]
+        try:
+            # The header is the start of an object ending in a comma, e.g. {"type":..,"metadata":{..},
+            self.metadata = json.loads(header + '"features": []}').get('metadata', {})
+        except json.JSONDecodeError:
+            logger.debug("Could not parse GeoJSON header, continuing without metadata")
+        self.position = bracket + 1
+
+    def __iter__(self):
+        self.read_header()
+        while True:
+            next_character = self.skip(',')
+            if next_character is None:
+                raise ValueError("GeoJSON response ended inside the features array")
+            if next_character == ']':
+                return
+            while True:
+                try:
+                    feature, end = self.decoder.raw_decode(self.buffer, self.position)
+                    break
+                except json.JSONDecodeError:
+                    # The feature is split across chunks
+                    if not self.read_more():
+                        raise
+            self.position = end
+            self.count += 1
+            properties = feature.get('properties', {})
+            updated = properties.get('updated')
+            if updated is not None and (self.max_updated is None or updated > self.max_updated):
+                self.max_updated = updated
+            event_time = properties.get('time')
+            if event_time is not None:
+                self.min_time = event_time if self.min_time is None else min(self.min_time, event_time)
+                self.max_time = event_time if self.max_time is None else max(self.max_time, event_time)
+            yield feature
+
+
+def encode_feature_collection(stream, batch_size=500, features=None):
+    """Re-encode a FeatureStream as FeatureCollection JSON bytes, a batch of features at a time.
+
+    `features` can wrap the stream (e.g. a tap that also lands the rows elsewhere).
+    """
+    features = iter(features if features is not None else stream)
+    first = next(features, None)
+    yield ('{"type": "FeatureCollection", "metadata": ' + json.dumps(stream.metadata) + ', "features": [').encode()
+    if first is not None:
+        batch = []
+        separator = ''
+        for feature in itertools.chain([first], features):
+            batch.append(json.dumps(feature))
+            if len(batch) >= batch_size:
+                yield (separator + ', '.join(batch)).encode()
+                batch = []
+                separator = ', '
+        if batch:
+            yield (separator + ', '.join(batch)).encode()
+    yield b']}'
+
+
+class IterStream(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks, for boto3's streaming uploads"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.leftover = b''
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.offset >= len(self.leftover):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.leftover = memoryview(chunk)
+            self.offset = 0
+        size = min(len(buffer), len(self.leftover) - self.offset)
+        buffer[:size] = self.leftover[self.offset:self.offset + size]
+        self.offset += size
+        return size
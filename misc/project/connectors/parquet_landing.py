@@ -0,0 +1,153 @@
+import datetime
+import logging
+import uuid
+from earthquake_common.fingerprint import FINGERPRINT_FIELD, row_fingerprint
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:
+    pa = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (column, USGS property, arrow type) in the same order stg_flatten_raw produces them
+PROPERTY_COLUMNS = [
+    ('id', None, 'string'),
+    ('magnitude', 'mag', 'float64'),
+    ('location', 'place', 'string'),
+    ('event_time', 'time', 'timestamp'),
+    ('updated_time', 'updated', 'timestamp'),
+    ('event_url', 'url', 'string'),
+    ('felt_reports', 'felt', 'int64'),
+    ('cdi', 'cdi', 'float64'),
+    ('mmi', 'mmi', 'float64'),
+    ('alert_level', 'alert', 'string'),
+    ('status', 'status', 'string'),
+    ('tsunami', 'tsunami', 'bool'),
+    ('significance', 'sig', 'int64'),
+    ('network', 'net', 'string'),
+    ('code', 'code', 'string'),
+    ('num_stations', 'nst', 'int64'),
+    ('min_distance', 'dmin', 'float64'),
+    ('rms', 'rms', 'float64'),
+    ('gap', 'gap', 'float64'),
+    ('mag_type', 'magType', 'string'),
+    ('event_type', 'type', 'string'),
+    ('event_title', 'title', 'string'),
+]
+COORDINATE_COLUMNS = ['longitude', 'latitude', 'depth']
+
+
+def arrow_type(name):
+    return {
+        'string': pa.string(),
+        'float64': pa.float64(),
+        'int64': pa.int64(),
+        'timestamp': pa.timestamp('ms'),
+        'bool': pa.bool_(),
+    }[name]
+
+
+def landing_schema():
+    fields = [
+        pa.field('batch_id', pa.string()),
+        pa.field('load_timestamp', pa.timestamp('ms', tz='UTC')),
+    ]
+    fields += [pa.field(column, pa.float64()) for column in COORDINATE_COLUMNS]
+    fields += [pa.field(column, arrow_type(type_name)) for column, _, type_name in PROPERTY_COLUMNS]
+    fields += [
+        pa.field('load_id', pa.int64()),
+        pa.field('event_date', pa.date32()),
+    ]
+    return pa.schema(fields)
+
+
+def flatten_feature(feature, batch_id, load_timestamp):
+    """Flatten one GeoJSON feature into a typed row matching stg_flatten_raw"""
+    properties = feature.get('properties') or {}
+    coordinates = (feature.get('geometry') or {}).get('coordinates') or []
+    row = {'batch_id': batch_id, 'load_timestamp': load_timestamp}
+    for index, column in enumerate(COORDINATE_COLUMNS):
+        value = coordinates[index] if index < len(coordinates) else None
+        row[column] = float(value) if value is not None else None
+    for column, property_name, type_name in PROPERTY_COLUMNS:
+        value = feature.get('id') if property_name is None else properties.get(property_name)
+        if value is not None:
+            if type_name == 'timestamp':
+                value = datetime.datetime.utcfromtimestamp(value / 1000)
+            elif type_name == 'float64':
+                value = float(value)
+            elif type_name == 'int64':
+                value = int(value)
+            elif type_name == 'bool':
+                value = bool(value)
+            else:
+                value = str(value)
+        row[column] = value
+    # Stamped when the payload landed; computed here for features read from older payloads
+    row['load_id'] = feature.get(FINGERPRINT_FIELD)
+    if row['load_id'] is None:
+        row['load_id'] = row_fingerprint(feature)
+    row['event_date'] = row['event_time'].date() if row['event_time'] else None
+    return row
+
+
+class ParquetLander:
+    """Writes flattened features as a Parquet dataset partitioned by event date.
+
+    `location` is a local directory or an `s3://bucket/prefix` URI. Rows are buffered
+    and written `batch_size` at a time, so memory is bounded by one batch.
+    """
+
+    def __init__(self, location: str, region_name: str = 'us-east-2', batch_size: int = 50000):
+        if pa is None:
+            raise Exception("Parquet landing requires the pyarrow package")
+        self.batch_size = batch_size
+        self.schema = landing_schema()
+        if location.startswith('s3://'):
+            self.filesystem = pafs.S3FileSystem(region=region_name)
+            self.base_dir = location[len('s3://'):]
+        else:
+            self.filesystem = pafs.LocalFileSystem()
+            self.base_dir = location
+        self.partitioning = ds.partitioning(pa.schema([pa.field('event_date', pa.date32())]), flavor='hive')
+
+    def write_rows(self, rows, batch_id, part):
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        ds.write_dataset(
+            table,
+            self.base_dir,
+            format='parquet',
+            filesystem=self.filesystem,
+            partitioning=self.partitioning,
+            basename_template=f"{batch_id}-{part}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+        )
+
+    def tap(self, features, batch_id=None):
+        """Yield features through unchanged while landing them as Parquet in batches"""
+        batch_id = batch_id or uuid.uuid4().hex
+        load_timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+        rows = []
+        part = 0
+        count = 0
+        for feature in features:
+            rows.append(flatten_feature(feature, batch_id, load_timestamp))
+            if len(rows) >= self.batch_size:
+                self.write_rows(rows, batch_id, part)
+                count += len(rows)
+                rows = []
+                part += 1
+            yield feature
+        if rows:
+            self.write_rows(rows, batch_id, part)
+            count += len(rows)
+        logger.info(f"Landed {count} rows as Parquet under {self.base_dir} (batch {batch_id})")
+
+    def write(self, data, batch_id=None):
+        """Land every feature of a FeatureCollection dict"""
+        for _ in self.tap(data.get('features', []), batch_id=batch_id):
+            pass
@@ -1,27 +1,146 @@
-import boto3
-import json
+import datetime
+import hashlib
+import itertools
 import logging
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
+from earthquake_common.landing import (
+    COMPRESSION_EXTENSIONS, MANIFEST_LATENESS_DAYS, MB, compress_chunks, encode_chunks, feature_stats,
+    format_event_time, get_s3_client, parse_event_time, partition_prefix, read_manifest, update_manifest,
+)
+from earthquake_common.metrics import registry
+from .geojson_stream import IterStream
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class HashingStream:
+    """Passes byte chunks through while hashing and counting them"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.sha256.update(chunk)
+            self.bytes += len(chunk)
+            yield chunk
+
+
 class S3Client:
-    def __init__(self, bucket_name: str, region_name: str = 'us-east-2'):
-        self.s3_client = boto3.client('s3', region_name=region_name)
+    def __init__(self, bucket_name: str, region_name: str = 'us-east-2', compression=None,
+                 multipart_threshold=16 * MB, multipart_chunksize=8 * MB, max_concurrency=8):
+        self.s3_client = get_s3_client(region_name)
         self.bucket_name = bucket_name
+        self.compression = compression
+        self.multipart_threshold = multipart_threshold
+        # Uploads above the threshold are split into parts sent concurrently
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+        )
+
+    def landing_key(self, s3_key, partition_date=None):
+        key_without_folder = s3_key.split('/')[-1] + COMPRESSION_EXTENSIONS.get(self.compression, '')
+        if partition_date is None:
+            return key_without_folder
+        return f"{partition_prefix(partition_date)}/{key_without_folder}"
+
+    def read_manifest(self, partition_date):
+        return read_manifest(self.s3_client, self.bucket_name, partition_date)
 
-    def upload_to_s3(self, data, s3_key):
+    def update_manifest(self, entry):
+        """Record a landed object in its own manifest entry, replacing any earlier entry for the key"""
+        return update_manifest(self.s3_client, self.bucket_name, entry)
+
+    def find_keys(self, start_time, end_time, lateness_days=MANIFEST_LATENESS_DAYS):
+        """Return landed keys whose event time range overlaps [start_time, end_time] (ISO 8601 strings).
+
+        Partitions are dated by landing rather than event time, so only those within
+        `lateness_days` either side of the range are read.
+        """
+        # Compared as datetimes: as strings, '...00.500Z' sorts before '...00Z'
+        start, end = parse_event_time(start_time), parse_event_time(end_time)
+        first = start.date() - datetime.timedelta(days=lateness_days)
+        last = end.date() + datetime.timedelta(days=lateness_days)
+        keys = []
+        for offset in range((last - first).days + 1):
+            manifest = self.read_manifest(first + datetime.timedelta(days=offset))
+            keys += [
+                entry['key'] for entry in manifest['files']
+                if entry['min_event_time']
+                and parse_event_time(entry['max_event_time']) >= start and parse_event_time(entry['min_event_time']) <= end
+            ]
+        return keys
+
+    def upload_to_s3(self, data, s3_key, partition_date=None):
+        """Upload a FeatureCollection dict; with a partition_date it lands under year=/month=/day= with a manifest entry"""
         try:
-            # Remove the folder path from s3_key to upload directly to the root of the bucket
-            key_without_folder = s3_key.split('/')[-1]
-            
-            self.s3_client.put_object(Bucket=self.bucket_name, Key=key_without_folder, Body=json.dumps(data))
-            logger.info(f"Data successfully uploaded to s3://{self.bucket_name}/{key_without_folder}")
+            key = self.landing_key(s3_key, partition_date)
+
+            body = HashingStream(encode_chunks(data, self.compression))
+            chunks = iter(body)
+            with registry.time('s3_upload_seconds'):
+                # Buffer only up to the multipart threshold; a larger payload streams on from there
+                head = []
+                for chunk in chunks:
+                    head.append(chunk)
+                    if body.bytes >= self.multipart_threshold:
+                        break
+                if body.bytes < self.multipart_threshold:
+                    self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=b''.join(head))
+                else:
+                    stream = IterStream(itertools.chain(head, chunks))
+                    self.s3_client.upload_fileobj(stream, self.bucket_name, key, Config=self.transfer_config)
+            registry.inc('s3_upload_bytes_total', body.bytes)
+            logger.info(f"Data successfully uploaded to s3://{self.bucket_name}/{key} ({body.bytes} bytes)")
+            if partition_date is not None:
+                self.update_manifest({
+                    'key': key,
+                    'bytes': body.bytes,
+                    'content_hash': body.sha256.hexdigest(),
+                    **feature_stats(data),
+                })
+            return key
         except (NoCredentialsError, PartialCredentialsError) as e:
             logger.error(f"Credentials error while accessing S3: {e}")
             raise
         except ClientError as e:
             logger.error(f"Client error while uploading to S3: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def upload_stream(self, chunks, s3_key, partition_date=None, feature_stream=None):
+        """Upload an iterator of byte chunks without materializing the whole body.
+
+        With a partition_date the manifest entry takes its row count and event time
+        range from `feature_stream`, the FeatureStream the chunks were encoded from.
+        """
+        try:
+            key = self.landing_key(s3_key, partition_date)
+
+            # upload_fileobj reads the stream in multipart-sized parts, so memory stays bounded
+            body = HashingStream(compress_chunks(chunks, self.compression))
+            with registry.time('s3_upload_seconds'):
+                self.s3_client.upload_fileobj(IterStream(body), self.bucket_name, key, Config=self.transfer_config)
+            registry.inc('s3_upload_bytes_total', body.bytes)
+            logger.info(f"Data successfully streamed to s3://{self.bucket_name}/{key}")
+            if partition_date is not None:
+                self.update_manifest({
+                    'key': key,
+                    'bytes': body.bytes,
+                    'content_hash': body.sha256.hexdigest(),
+                    'rows': feature_stream.count if feature_stream else None,
+                    'min_event_time': format_event_time(feature_stream.min_time) if feature_stream else None,
+                    'max_event_time': format_event_time(feature_stream.max_time) if feature_stream else None,
+                })
+            return key
+        except (NoCredentialsError, PartialCredentialsError) as e:
+            logger.error(f"Credentials error while accessing S3: {e}")
+            raise
+        except ClientError as e:
+            logger.error(f"Client error while uploading to S3: {e}")
+            raise
@@ -0,0 +1,82 @@
+import datetime
+import logging
+import threading
+import time
+from .airbyte_client import TERMINAL_STATUSES
+from earthquake_common.metrics import registry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def job_start(job):
+    """Epoch seconds of an Airbyte job's startTime, or None if it has not started"""
+    value = (job or {}).get("startTime")
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class SyncCoalescer:
+    """Folds many landed files into as few Airbyte syncs as possible for one connection.
+
+    Landings are only recorded; `poll` starts a sync when none is in flight, so one job
+    covers every file landed before it started. An in-flight job, ours or started
+    elsewhere, is attached to rather than queueing another, and files that landed after
+    it started are picked up by a single follow-up sync once it finishes.
+    """
+
+    def __init__(self, airbyte_client, connection_id: str):
+        self.airbyte_client = airbyte_client
+        self.connection_id = connection_id
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.first_landed = None
+        self.last_landed = None
+        self.active_job_id = None
+
+    def notify_landed(self, count: int = 1):
+        """Record files that have landed and still need a sync"""
+        with self.lock:
+            self.pending += count
+            self.last_landed = time.time()
+            if self.first_landed is None:
+                self.first_landed = self.last_landed
+
+    def covered(self):
+        """Pending files are now covered by a sync; record how long the oldest of them waited"""
+        registry.observe('airbyte_queue_seconds', time.time() - self.first_landed)
+        self.pending = 0
+        self.first_landed = None
+
+    def poll(self):
+        """Start or attach to a sync covering the pending files; returns its job id, or None if nothing was started"""
+        with self.lock:
+            if not self.pending:
+                return None
+            job = self.airbyte_client.latest_job(self.connection_id)
+            if job and job.get("status") not in TERMINAL_STATUSES:
+                job_id = str(job["jobId"])
+                self.active_job_id = job_id
+                started = job_start(job)
+                if started is not None and started >= self.last_landed:
+                    logger.info(f"Attached {self.pending} landed files to in-flight sync job {job_id}")
+                    self.covered()
+                    return job_id
+                logger.info(f"Sync job {job_id} is {job.get('status')}, {self.pending} landed files wait for the follow-up sync")
+                return None
+            job_id = str(self.airbyte_client.trigger_sync(self.connection_id))
+            logger.info(f"Started sync job {job_id} covering {self.pending} landed files")
+            self.active_job_id = job_id
+            self.covered()
+            return job_id
+
+    def flush(self, timeout: float = 3600):
+        """Block until every pending file is covered by a finished sync and return that sync's status"""
+        while self.pending:
+            job_id = self.poll()
+            if job_id:
+                return self.airbyte_client.wait_for_job(job_id, timeout=timeout)
+            # A sync that started before the last landing is running; let it finish, then follow up
+            self.airbyte_client.wait_for_job(self.active_job_id, timeout=timeout)
+        return None
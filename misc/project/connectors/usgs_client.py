@@ -1,23 +1,158 @@
+import email.utils
+import random
+import time
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+from .geojson_stream import FeatureStream
+from earthquake_common.response_cache import cache_key, content_hash
+from earthquake_common.metrics import registry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Statuses worth retrying: throttling, maintenance and transient gateway errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
 class USGSClient:
-    def __init__(self, url):
+    def __init__(self, url, timeout=(5, 60), max_retries=5, backoff_factor=1.0, max_backoff=60, pool_maxsize=10, cache=None):
         self.url = url
+        self.cache = cache  # Optional ResponseCache for conditional requests
+        self.timeout = timeout  # (connect, read) seconds
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+        # One pooled session per client so repeated polls reuse the TCP/TLS connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+
+    def close(self):
+        self.session.close()
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+    @staticmethod
+    def retry_after(response):
+        """Return the Retry-After delay in seconds, or None if the header is absent or invalid"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        if value.isdigit():
+            return int(value)
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, url, params, stream=False, headers=None):
+        """GET with retries on connection errors and retryable statuses"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout, stream=stream, headers=headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"USGS request failed ({e}), retrying in {delay:.1f} seconds")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = self.retry_after(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                logger.warning(f"USGS returned {response.status_code}, retrying in {delay:.1f} seconds")
+            time.sleep(delay)
 
-    def fetch_data(self, start_time_str, end_time_str):
+    def timed_get(self, params, headers=None):
+        """GET the event query, recording its latency, status and body size"""
+        with registry.time('usgs_request_seconds'):
+            response = self.get(self.url, params=params, headers=headers)
+        registry.inc('usgs_requests_total', status=response.status_code)
+        registry.inc('usgs_response_bytes_total', len(response.content))
+        return response
+
+    @staticmethod
+    def record_features(data):
+        registry.inc('usgs_features_total', len(data.get('features', [])))
+        return data
+
+    def fetch_data(self, start_time_str, end_time_str, updated_after=None):
         try:
             params = {
                 'format': 'geojson',
                 'starttime': start_time_str,
                 'endtime': end_time_str,
             }
-            response = requests.get(self.url, params=params)
-            response.raise_for_status()  # This will raise an HTTPError if the response was not successful
-            return response.json()
+            if updated_after:
+                # Only return events created or revised since the last successful run
+                params['updatedafter'] = updated_after
+            if not self.cache:
+                response = self.timed_get(params)
+                response.raise_for_status()  # This will raise an HTTPError if the response was not successful
+                return self.record_features(response.json())
+
+            # Returns None when the feed has not changed since the last landed payload
+            key = cache_key(self.url, params)
+            response = self.timed_get(params, headers=self.cache.conditional_headers(key))
+            if response.status_code == 304:
+                logger.info("USGS returned 304 Not Modified")
+                return None
+            response.raise_for_status()
+            data = self.record_features(response.json())
+            if not data.get('features'):
+                # Nothing to land, so nothing to stage
+                return data
+            data_hash = content_hash(data)
+            if self.cache.is_unchanged(key, data_hash):
+                logger.info("USGS payload is unchanged since the last run")
+                return None
+            self.cache.stage(key, response, data_hash)
+            return data
         except requests.RequestException as e:
             logger.error(f"Failed to fetch data from USGS API: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def stream_features(self, start_time_str, end_time_str, updated_after=None, chunk_size=64 * 1024):
+        """Return a FeatureStream that parses features as the response body arrives"""
+        try:
+            params = {
+                'format': 'geojson',
+                'starttime': start_time_str,
+                'endtime': end_time_str,
+            }
+            if updated_after:
+                params['updatedafter'] = updated_after
+            response = self.get(self.url, params=params, stream=True)
+            response.raise_for_status()
+            # iter_content transparently decompresses gzip responses
+            return FeatureStream(response.iter_content(chunk_size=chunk_size))
+        except requests.RequestException as e:
+            logger.error(f"Failed to fetch data from USGS API: {e}")
+            raise
+
+    def count(self, start_time_str, end_time_str):
+        """Return the number of events in a window and the maximum a single query may return"""
+        count_url = self.url.rsplit('/', 1)[0] + '/count'
+        try:
+            params = {
+                'format': 'geojson',
+                'starttime': start_time_str,
+                'endtime': end_time_str,
+            }
+            response = self.get(count_url, params=params)
+            response.raise_for_status()
+            result = response.json()
+            return result['count'], result.get('maxAllowed', 20000)
+        except requests.RequestException as e:
+            logger.error(f"Failed to count events from USGS API: {e}")
+            raise
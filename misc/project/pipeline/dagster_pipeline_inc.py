@@ -20,7 +20,7 @@ def fetch_earthquake_data(start_time_str: str, end_time_str: str) -> dict:
     try:
         client = USGSClient(os.getenv('USGS_URL'))
         data = client.fetch_data(start_time_str, end_time_str)
-        logger.info(f"Fetched {len(data)} records from USGS API")
+        logger.info(f"Fetched {len(data.get('features', []))} records from USGS API")
         return data
     except Exception as e:
         logger.error(f"Error fetching earthquake data: {e}")
@@ -78,7 +78,9 @@
 
 
 import os
+import asyncio
 import datetime
+import itertools
 import logging
 import pytz
 import time
@@ -86,6 +88,12 @@ from dotenv import load_dotenv
 from connectors.s3_client import S3Client
 from connectors.airbyte_client import AirbyteClient
 from connectors.usgs_client import USGSClient
+from earthquake_common.watermark import WatermarkStore, format_usgs_time, max_updated
+from earthquake_common.response_cache import ResponseCache
+from connectors.parquet_landing import ParquetLander
+from connectors.sync_coalescer import SyncCoalescer
+from earthquake_common.fingerprint import stamp_fingerprints
+from earthquake_common import metrics
 
 # Configure Logging
 logging.basicConfig(level=logging.DEBUG,
@@ -115,55 +123,214 @@ def calculate_times():
     logger.debug(f"Calculated times - Start Time (UTC): {start_time_str}, End Time (UTC): {end_time_str}, Start Time (EST): {start_time_est_str}")
     return start_time_str, end_time_str, start_time_est_str
 
+# Once a watermark exists, look back over the USGS default 30 day window for revised events
+WATERMARK_LOOKBACK_DAYS = int(os.getenv('WATERMARK_LOOKBACK_DAYS', 30))
+
+watermark_store = WatermarkStore(os.getenv('USGS_WATERMARK_PATH', 'usgs_watermark.json'), os.getenv('AWS_REGION'))
+
+# Watermark of the newest payload queued for upload. Fetches continue from it rather than the
+# stored watermark, which only moves once an upload lands, so a slow upload is not fetched twice
+fetched_through = None
+
+# Payloads queued but not landed, by fetch sequence, with the watermark each was fetched after.
+# The stored watermark never passes one of these, whatever order concurrent uploads finish in
+unlanded = {}
+failed_uploads = set()
+fetch_sequence = itertools.count()
+
+# One client for every upload instead of one per call
+s3_client = S3Client(os.getenv('S3_BUCKET'), os.getenv('AWS_REGION'), compression=os.getenv('S3_COMPRESSION') or None)
+
+# Uploads started in the same second still get distinct object names
+upload_sequence = itertools.count()
+
+# Shared across jobs so every poll reuses the same keep-alive connection
+usgs_client = USGSClient(
+    os.getenv('USGS_URL'),
+    timeout=(5, int(os.getenv('USGS_READ_TIMEOUT', 60))),
+    cache=ResponseCache(os.getenv('USGS_CACHE_PATH', 'usgs_cache.json')),
+)
+
+# Optional typed Parquet copy of every landed payload, partitioned by event date
+parquet_lander = ParquetLander(os.getenv('PARQUET_LANDING_PATH'), os.getenv('AWS_REGION')) if os.getenv('PARQUET_LANDING_PATH') else None
+
+# Landed files are batched into one sync per Airbyte job instead of one sync per run
+airbyte_client = AirbyteClient(
+    server_name=os.getenv('AIRBYTE_SERVER_NAME'),
+    username=os.getenv('AIRBYTE_USERNAME'),
+    password=os.getenv('AIRBYTE_PASSWORD')
+)
+sync_coalescer = SyncCoalescer(airbyte_client, os.getenv('AIRBYTE_CONNECTION_ID'))
+
+# Async runner settings: fetch cadence, per-stage concurrency and queue bounds
+PIPELINE_INTERVAL = float(os.getenv('PIPELINE_INTERVAL', 5))
+FETCH_CONCURRENCY = int(os.getenv('FETCH_CONCURRENCY', 1))
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 2))
+UPLOAD_QUEUE_SIZE = int(os.getenv('UPLOAD_QUEUE_SIZE', 4))
+SYNC_QUEUE_SIZE = int(os.getenv('SYNC_QUEUE_SIZE', 1000))
+AIRBYTE_SYNC_TIMEOUT = int(os.getenv('AIRBYTE_SYNC_TIMEOUT', 3600))
+# Port of the Prometheus /metrics endpoint; unset disables it
+METRICS_PORT = os.getenv('METRICS_PORT')
+
 def fetch_earthquake_data():
+    """Return the payload along with the watermark it was fetched after"""
     start_time_str, end_time_str, _ = calculate_times()
-    logger.info(f"Fetching earthquake data from USGS API for period: {start_time_str} to {end_time_str}")
-    client = USGSClient(os.getenv('USGS_URL'))
-    data = client.fetch_data(start_time_str, end_time_str)
-    logger.info(f"Fetched {len(data)} records from USGS API")
-    return data
+    watermark = fetched_through if fetched_through is not None else watermark_store.read()
+    updated_after = None
+    if watermark is not None:
+        start_time = datetime.datetime.utcnow() - datetime.timedelta(days=WATERMARK_LOOKBACK_DAYS)
+        start_time_str = start_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+        updated_after = format_usgs_time(watermark)
+    logger.info(f"Fetching earthquake data from USGS API for period: {start_time_str} to {end_time_str}, updated after: {updated_after}")
+    data = usgs_client.fetch_data(start_time_str, end_time_str, updated_after=updated_after)
+    if data is not None:
+        logger.info(f"Fetched {len(data.get('features', []))} records from USGS API")
+    return data, watermark
+
+def landed_watermark(sequence, data):
+    """The newest watermark safe to store once payload `sequence` has landed, or None to keep the current one"""
+    fetched_after = unlanded.pop(sequence)
+    # A failed payload is covered once one fetched later, from at or before its watermark, lands
+    for other in sorted(failed_uploads):
+        if other < sequence and (fetched_after is None or (unlanded[other] is not None and fetched_after <= unlanded[other])):
+            failed_uploads.discard(other)
+            del unlanded[other]
+    candidate = max_updated(data)
+    for other_after in unlanded.values():
+        if candidate is None or other_after is None:
+            return None
+        candidate = min(candidate, other_after)
+    return candidate
 
 def upload_to_s3(data):
     _, _, start_time_est_str = calculate_times()
-    s3_client = S3Client(os.getenv('S3_BUCKET'), os.getenv('AWS_REGION'))
-    filename = f"{start_time_est_str}.json"  # Use EST formatted date-time for the file name
+    # Use EST formatted date-time for the file name, shared by the S3 object and its Parquet copy
+    batch_id = f"{start_time_est_str}-{next(upload_sequence):04d}"
+    filename = f"{batch_id}.json"
     s3_key = f"{os.getenv('CURRENT_PREFIX')}/{filename}"
     logger.info(f"Uploading data to S3 - Filename: {filename}, S3 Key: {s3_key}")
-    s3_client.upload_to_s3(data, s3_key)
+    data['features'] = list(stamp_fingerprints(data.get('features', [])))
+    # Land under year=/month=/day= of the run so readers can prune by partition
+    s3_client.upload_to_s3(data, s3_key, partition_date=datetime.datetime.utcnow().date())
     logger.info("Data uploaded successfully")
+    if parquet_lander:
+        parquet_lander.write(data, batch_id=batch_id)
+
+
+async def fetch_stage(upload_queue):
+    """Fetch on a fixed cadence, skipping a tick while FETCH_CONCURRENCY fetches are still running"""
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    tasks = set()
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+
+    async def fetch():
+        async with semaphore:
+            try:
+                with metrics.registry.time('pipeline_stage_seconds', stage='fetch'):
+                    data, fetched_after = await asyncio.to_thread(fetch_earthquake_data)
+                if data is None:
+                    logger.info("USGS feed not modified since the last run, skipping upload")
+                    return
+                if not data.get('features'):
+                    logger.info("No new or updated events since the last run, skipping upload")
+                    return
+                # Snapshot the cache entries staged for this payload so its upload commits only those
+                with usgs_client.cache.lock:
+                    staged = dict(usgs_client.cache.pending)
+                sequence = next(fetch_sequence)
+                unlanded[sequence] = fetched_after
+                await upload_queue.put((sequence, data, staged))
+                # The next fetch starts after this payload instead of waiting for its upload to land
+                global fetched_through
+                fetched_through = max((value for value in (fetched_through, max_updated(data)) if value is not None), default=None)
+            except Exception as e:
+                logger.error(f"An error occurred while fetching: {e}")
 
-def trigger_sync():
-    airbyte_client = AirbyteClient(
-        server_name=os.getenv('AIRBYTE_SERVER_NAME'),
-        username=os.getenv('AIRBYTE_USERNAME'),
-        password=os.getenv('AIRBYTE_PASSWORD')
-    )
-    logger.info(f"Triggering Airbyte sync for connection ID: {os.getenv('AIRBYTE_CONNECTION_ID')}")
-    job_id = airbyte_client.trigger_sync(os.getenv('AIRBYTE_CONNECTION_ID'))
-    logger.info(f"Triggered Airbyte sync job with Job ID: {job_id}")
-    
-    # Check the status of the sync job
-    logger.info(f"Checking status of Airbyte sync job with Job ID: {job_id}")
-    job_status = airbyte_client.check_job_status(job_id)
-    logger.info(f"Airbyte sync job completed with status: {job_status}")
-
-def job():
-    logger.info("Starting job execution...")
-    try:
-        data = fetch_earthquake_data()
-        upload_to_s3(data)
-        trigger_sync()
-        logger.info("Job executed successfully")
-    except Exception as e:
-        logger.error(f"An error occurred during job execution: {e}")
-
-# Main loop to run the job immediately and then every 5 seconds
-if __name__ == "__main__":
-    logger.info("Starting the job scheduler...")
     while True:
-        job()  # Run the job immediately
-        logger.info("Waiting for 5 seconds before the next run...")
-        time.sleep(5)  # Wait for 5 seconds before running the job again
+        if semaphore.locked():
+            logger.warning("Previous fetch still running, skipping this tick")
+        else:
+            task = asyncio.create_task(fetch())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        # Ticks are scheduled from the start time, so cadence does not drift with stage latency
+        next_tick += PIPELINE_INTERVAL
+        now = loop.time()
+        if next_tick < now:
+            next_tick = now + PIPELINE_INTERVAL - (now - next_tick) % PIPELINE_INTERVAL
+        await asyncio.sleep(next_tick - now)
+
+
+async def upload_stage(upload_queue, sync_queue):
+    """Land one payload at a time; UPLOAD_CONCURRENCY of these run side by side"""
+    while True:
+        sequence, data, staged = await upload_queue.get()
+        try:
+            try:
+                with metrics.registry.time('pipeline_stage_seconds', stage='upload'):
+                    await asyncio.to_thread(upload_to_s3, data)
+            except Exception as e:
+                logger.error(f"An error occurred while uploading: {e}")
+                # Rewind, so the next fetch picks up the payload that failed to land
+                global fetched_through
+                fetched_after = unlanded[sequence]
+                if fetched_after is None or fetched_through is None:
+                    fetched_through = None
+                else:
+                    fetched_through = min(fetched_through, fetched_after)
+                failed_uploads.add(sequence)
+                continue
+            await sync_queue.put(1)
+            # Only advance the watermark and cache once the data has landed, so a failed upload is retried next run
+            try:
+                watermark_store.advance_to(landed_watermark(sequence, data))
+                usgs_client.cache.commit(staged)
+            except Exception as e:
+                logger.error(f"An error occurred while recording a landed payload: {e}")
+        finally:
+            upload_queue.task_done()
+
+
+async def sync_stage(sync_queue):
+    """Fold every landing queued so far into one Airbyte sync and wait for it without blocking the other stages"""
+    while True:
+        if not sync_coalescer.pending:
+            await sync_queue.get()
+            sync_coalescer.notify_landed()
+        while not sync_queue.empty():
+            sync_queue.get_nowait()
+            sync_coalescer.notify_landed()
+        try:
+            # With a sync already in flight, wait for it and then start the follow-up
+            job_id = await asyncio.to_thread(sync_coalescer.poll) or sync_coalescer.active_job_id
+            started = time.perf_counter()
+            status = await airbyte_client.wait_for_job_async(job_id, timeout=AIRBYTE_SYNC_TIMEOUT)
+            metrics.registry.observe('airbyte_sync_seconds', time.perf_counter() - started, status=status)
+            logger.info(f"Airbyte sync job {job_id} finished with status: {status}")
+        except Exception as e:
+            logger.error(f"An error occurred while syncing: {e}")
+            await asyncio.sleep(PIPELINE_INTERVAL)
+
+
+async def run_pipeline():
+    """Run fetch, upload and sync as independent stages joined by bounded queues.
+
+    A full upload queue holds back fetches, and a slow Airbyte job only delays the
+    sync stage, so fetching keeps its PIPELINE_INTERVAL cadence under load.
+    """
+    if METRICS_PORT:
+        metrics.start_http_server(int(METRICS_PORT))
+    upload_queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    sync_queue = asyncio.Queue(maxsize=SYNC_QUEUE_SIZE)
+    stages = [fetch_stage(upload_queue), sync_stage(sync_queue)]
+    stages += [upload_stage(upload_queue, sync_queue) for _ in range(UPLOAD_CONCURRENCY)]
+    await asyncio.gather(*stages)
+
+# Main loop: fetch every PIPELINE_INTERVAL seconds while uploads and syncs run concurrently
+if __name__ == "__main__":
+    logger.info(f"Starting the pipeline runner with a {PIPELINE_INTERVAL} second cadence...")
+    asyncio.run(run_pipeline())
 
 
 # import datetime
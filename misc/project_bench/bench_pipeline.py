@@ -0,0 +1,273 @@
+"""End-to-end pipeline benchmark against local stand-ins for USGS, S3 and Airbyte.
+
+Runs the real USGSClient -> S3Client -> AirbyteClient path, and the Dagster
+`earthquake_pipeline` job, against a fake FDSN server serving a synthetic catalog,
+an S3-compatible store on local disk and a fake Airbyte API. The fakes run in a child
+process so they do not compete with the code under test for the GIL or show up in its
+memory. Reports throughput, per-stage latency and peak memory.
+
+Run from misc/:
+    python -m project_bench.bench_pipeline --events 20000 --runs 5 --compression gzip
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from .fake_services import run_services
+
+BUCKET = 'earthquake-bench'
+REGION = 'us-east-1'
+CONNECTION_ID = 'bench-connection'
+DAGSTER_PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'app', 'dagster_elt'))
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+class StageRecorder:
+    """Wall time of every pass through each stage, and the peak traced Python memory seen inside it"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.peaks = {}
+        # Peak so far of every stage currently open, so nested stages do not hide it from their parent
+        self.open = {}
+
+    def fold_peak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for name in self.open:
+            self.open[name] = max(self.open[name], peak)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.fold_peak()
+        tracemalloc.reset_peak()
+        self.open[name] = 0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+            self.fold_peak()
+            self.peaks[name] = max(self.peaks.get(name, 0), self.open.pop(name))
+
+    def record(self, name, seconds):
+        self.latencies[name].append(seconds)
+
+    def summary(self):
+        return {
+            name: {
+                'count': len(values),
+                'mean_ms': 1000 * sum(values) / len(values),
+                'p50_ms': 1000 * percentile(values, 0.5),
+                'p95_ms': 1000 * percentile(values, 0.95),
+                'max_ms': 1000 * max(values),
+                # Stages timed from Dagster step stats run outside the recorder and have no peak
+                'peak_traced_mb': self.peaks[name] / 2 ** 20 if name in self.peaks else None,
+            }
+            for name, values in self.latencies.items()
+        }
+
+
+def start_services(args, s3_root):
+    """Start the fakes in a child process and return it with the endpoints it listens on"""
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    process = context.Process(
+        target=run_services,
+        args=(args.events, s3_root, args.sync_seconds, args.airbyte_host, ready),
+        daemon=True,
+    )
+    process.start()
+    return process, ready.get(timeout=300)
+
+
+def configure_environment(endpoints, args, workdir):
+    """Point boto3 and the pipeline settings at the fakes, before any client is created"""
+    os.environ.update({
+        'AWS_ENDPOINT_URL_S3': endpoints['s3_endpoint'],
+        'AWS_ACCESS_KEY_ID': 'bench',
+        'AWS_SECRET_ACCESS_KEY': 'bench',
+        'AWS_REGION': REGION,
+        # The fake store takes plain bodies, not aws-chunked uploads with trailing checksums
+        'AWS_REQUEST_CHECKSUM_CALCULATION': 'when_required',
+        'AWS_RESPONSE_CHECKSUM_VALIDATION': 'when_required',
+        'S3_BUCKET': BUCKET,
+        'S3_COMPRESSION': args.compression or '',
+        'USGS_URL': endpoints['usgs_url'],
+        'USGS_WATERMARK_PATH': os.path.join(workdir, 'usgs_watermark.json'),
+        'USGS_CACHE_PATH': os.path.join(workdir, 'usgs_cache.json'),
+        'AIRBYTE_SERVER_NAME': endpoints['airbyte_server_name'],
+        'AIRBYTE_USERNAME': 'bench',
+        'AIRBYTE_PASSWORD': 'bench',
+        'AIRBYTE_CONNECTION_ID': CONNECTION_ID,
+    })
+
+
+def landed_bytes(s3, keys):
+    return sum(s3.head_object(Bucket=BUCKET, Key=key)['ContentLength'] for key in keys)
+
+
+def bench_clients(endpoints, args):
+    """Fetch, fingerprint and land the catalog, then sync it, `args.runs` times through the connector clients"""
+    from project.connectors.usgs_client import USGSClient
+    from project.connectors.s3_client import S3Client, get_s3_client
+    from project.connectors.airbyte_client import AirbyteClient
+    from earthquake_common.fingerprint import stamp_fingerprints
+
+    get_s3_client.cache_clear()
+    usgs_client = USGSClient(endpoints['usgs_url'])
+    s3_client = S3Client(BUCKET, REGION, compression=args.compression)
+    airbyte_client = AirbyteClient(endpoints['airbyte_server_name'], 'bench', 'bench')
+    recorder = StageRecorder()
+    events, keys = 0, []
+    end_time = datetime.datetime.utcnow()
+    start_time = end_time - datetime.timedelta(days=1)
+
+    started = time.perf_counter()
+    for run in range(args.runs):
+        with recorder.stage('run'):
+            with recorder.stage('fetch'):
+                data = usgs_client.fetch_data(start_time.strftime('%Y-%m-%dT%H:%M:%SZ'), end_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
+            with recorder.stage('upload'):
+                data['features'] = list(stamp_fingerprints(data['features']))
+                keys.append(s3_client.upload_to_s3(data, f"bench-{run:04d}.json", partition_date=end_time.date()))
+            with recorder.stage('sync'):
+                job_id = airbyte_client.trigger_sync(CONNECTION_ID)
+                airbyte_client.wait_for_job(job_id, initial_interval=args.poll_interval)
+        events += len(data['features'])
+        del data
+    elapsed = time.perf_counter() - started
+    usgs_client.close()
+    return report('clients', recorder, elapsed, events, landed_bytes(s3_client.s3_client, keys))
+
+
+def bench_dagster(endpoints, args):
+    """Execute `earthquake_pipeline` in process `args.runs` times, timing each op from the run's step stats.
+
+    The job returns as soon as the sync is triggered, so waiting for the sync to finish
+    is timed separately as `sync_wait`.
+    """
+    sys.path.insert(0, DAGSTER_PROJECT_DIR)
+    from dagster import DagsterInstance
+    from dagster_elt.jobs import earthquake_pipeline
+    from earthquake_common.landing import get_s3_client
+    from dagster_elt.resources import AirbyteResource, MappedPayloadIOManager
+    from project.connectors.airbyte_client import AirbyteClient
+
+    get_s3_client.cache_clear()
+    airbyte_conn = AirbyteResource(
+        server_name=endpoints['airbyte_server_name'],
+        username='bench',
+        password='bench',
+        connection_id=CONNECTION_ID,
+    )
+    airbyte_client = AirbyteClient(endpoints['airbyte_server_name'], 'bench', 'bench')
+    run_config = {
+        'ops': {'fetch_earthquake_data': {'config': {'usgs_url': endpoints['usgs_url']}}},
+        # Per-event console logging would otherwise be part of what is measured
+        'loggers': {'console': {'config': {'log_level': 'WARNING'}}},
+    }
+    recorder = StageRecorder()
+    events, keys = 0, []
+
+    with DagsterInstance.ephemeral() as instance:
+        started = time.perf_counter()
+        for _ in range(args.runs):
+            with recorder.stage('run'):
+                result = earthquake_pipeline.execute_in_process(
+                    run_config=run_config,
+                    resources={'airbyte_conn': airbyte_conn, 'payload_io_manager': MappedPayloadIOManager()},
+                    instance=instance,
+                )
+            for step in instance.get_run_step_stats(result.run_id):
+                recorder.record(step.step_key, step.end_time - step.start_time)
+            with recorder.stage('sync_wait'):
+                airbyte_client.wait_for_job(result.output_for_node('trigger_airbyte_sync'), initial_interval=args.poll_interval)
+            for event in result.get_asset_materialization_events():
+                metadata = event.materialization.metadata
+                events += metadata['rows'].value
+                keys.append(metadata['s3_key'].value)
+        elapsed = time.perf_counter() - started
+    return report('dagster', recorder, elapsed, events, landed_bytes(get_s3_client(REGION), keys))
+
+
+def report(target, recorder, elapsed, events, landed):
+    return {
+        'target': target,
+        'elapsed_s': elapsed,
+        'events': events,
+        'landed_bytes': landed,
+        'events_per_s': events / elapsed if elapsed else None,
+        'landed_mb_per_s': landed / 2 ** 20 / elapsed if elapsed else None,
+        'stages': recorder.summary(),
+    }
+
+
+def print_report(result):
+    print(f"\n== {result['target']}: {result['events']} events, {result['landed_bytes'] / 2 ** 20:.1f} MB landed in {result['elapsed_s']:.2f}s "
+          f"({result['events_per_s']:.0f} events/s, {result['landed_mb_per_s']:.2f} MB/s)")
+    print(f"{'stage':<28}{'n':>4}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'peak MB':>10}")
+    for name, stats in result['stages'].items():
+        peak = '-' if stats['peak_traced_mb'] is None else f"{stats['peak_traced_mb']:.1f}"
+        print(f"{name:<28}{stats['count']:>4}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+              f"{stats['max_ms']:>10.1f}{peak:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--events', type=int, default=5000, help='features in the synthetic catalog served per query')
+    parser.add_argument('--runs', type=int, default=5, help='pipeline runs per target')
+    parser.add_argument('--targets', default='clients,dagster', help='comma separated: clients, dagster')
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None)
+    parser.add_argument('--sync-seconds', type=float, default=0.5, help='how long each fake Airbyte sync runs')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='first Airbyte status poll interval')
+    parser.add_argument('--airbyte-host', default='127.0.0.1', help='loopback address for the fake Airbyte API, which must use port 8001')
+    parser.add_argument('--s3-root', default=None, help='directory the fake S3 store writes to; kept after the run (a temporary directory otherwise)')
+    parser.add_argument('--output', default=None, help='also write the results as JSON to this path')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, force=True)
+    benchmarks = {'clients': bench_clients, 'dagster': bench_dagster}
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        s3_root = args.s3_root or os.path.join(workdir, 's3')
+        process, endpoints = start_services(args, s3_root)
+        try:
+            configure_environment(endpoints, args, workdir)
+            tracemalloc.start()
+            for target in args.targets.split(','):
+                result = benchmarks[target](endpoints, args)
+                print_report(result)
+                results.append(result)
+            tracemalloc.stop()
+        finally:
+            process.terminate()
+    # ru_maxrss is in kilobytes on Linux
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nprocess peak RSS: {max_rss_mb:.1f} MB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'max_rss_mb': max_rss_mb, 'results': results}, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
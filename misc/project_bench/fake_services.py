@@ -0,0 +1,315 @@
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+# AirbyteClient and AirbyteResource always talk to port 8001 of the configured server
+AIRBYTE_PORT = 8001
+
+FDSN_QUERY_PATH = '/fdsnws/event/1/query'
+FDSN_COUNT_PATH = '/fdsnws/event/1/count'
+
+EVENT_TYPES = ['earthquake', 'earthquake', 'earthquake', 'quarry blast', 'explosion']
+ALERT_LEVELS = [None, None, None, 'green', 'yellow', 'orange', 'red']
+NETWORKS = ['us', 'ci', 'nc', 'ak', 'hv', 'nn', 'uw']
+
+
+def synthetic_feature(rng, index, start_ms, span_ms):
+    """One USGS-shaped GeoJSON feature with plausible values and the usual missing properties"""
+    network = rng.choice(NETWORKS)
+    code = f"{index:08d}"
+    event_time = start_ms + rng.randrange(span_ms)
+    magnitude = round(rng.uniform(-1.0, 7.5), 2) if rng.random() > 0.02 else None
+    latitude = round(rng.uniform(-80, 80), 4)
+    longitude = round(rng.uniform(-180, 180), 4)
+    return {
+        'type': 'Feature',
+        'properties': {
+            'mag': magnitude,
+            'place': f"{rng.randint(1, 120)} km {rng.choice('NSEW')} of Synthetic {rng.randint(1, 500)}",
+            'time': event_time,
+            'updated': event_time + rng.randrange(3600000),
+            'tz': None,
+            'url': f"https://earthquake.usgs.gov/earthquakes/eventpage/{network}{code}",
+            'detail': f"https://earthquake.usgs.gov/fdsnws/event/1/query?eventid={network}{code}&format=geojson",
+            'felt': rng.randint(0, 500) if rng.random() < 0.1 else None,
+            'cdi': round(rng.uniform(1, 9), 1) if rng.random() < 0.1 else None,
+            'mmi': round(rng.uniform(1, 9), 3) if rng.random() < 0.05 else None,
+            'alert': rng.choice(ALERT_LEVELS),
+            'status': rng.choice(['automatic', 'reviewed']),
+            'tsunami': int(rng.random() < 0.01),
+            'sig': rng.randint(0, 1000),
+            'net': network,
+            'code': code,
+            'ids': f",{network}{code},",
+            'sources': f",{network},",
+            'types': ',origin,phase-data,',
+            'nst': rng.randint(3, 200) if rng.random() > 0.3 else None,
+            'dmin': round(rng.uniform(0, 5), 5) if rng.random() > 0.3 else None,
+            'rms': round(rng.uniform(0, 1.5), 4),
+            'gap': rng.randint(10, 300) if rng.random() > 0.3 else None,
+            'magType': rng.choice(['ml', 'md', 'mb', 'mww']),
+            'type': rng.choice(EVENT_TYPES),
+            'title': f"M {magnitude} - synthetic event {index}",
+        },
+        'geometry': {'type': 'Point', 'coordinates': [longitude, latitude, round(rng.uniform(-3, 700), 2)]},
+        'id': f"{network}{code}",
+    }
+
+
+def synthetic_catalog(events, seed=0, revision=0, start_ms=1704067200000, span_ms=86400000):
+    """FeatureCollection of `events` features; each revision bumps `updated` on every feature, as a USGS re-review would"""
+    rng = random.Random(seed)
+    features = [synthetic_feature(rng, index, start_ms, span_ms) for index in range(events)]
+    for feature in features:
+        feature['properties']['updated'] += revision
+    return {
+        'type': 'FeatureCollection',
+        'metadata': {
+            'generated': int(time.time() * 1000),
+            'url': f"http://localhost{FDSN_QUERY_PATH}",
+            'title': 'Synthetic USGS Earthquakes',
+            'status': 200,
+            'api': '1.14.1',
+            'count': events,
+        },
+        'features': features,
+    }
+
+
+class FakeFDSN:
+    """Serves a synthetic catalog on the USGS FDSN event query and count endpoints.
+
+    Bodies are encoded (and gzipped) up front so the server adds as little as possible to
+    the measured fetch time. Successive queries alternate between two revisions of the
+    catalog, so the response cache never sees the same payload twice in a row and every
+    run lands a file.
+    """
+
+    def __init__(self, events, seed=0):
+        self.events = events
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.bodies = []
+        for revision in range(2):
+            body = json.dumps(synthetic_catalog(events, seed=seed, revision=revision)).encode()
+            self.bodies.append((body, gzip.compress(body, compresslevel=6)))
+
+    def handle(self, handler):
+        path = urlsplit(handler.path).path
+        if path == FDSN_COUNT_PATH:
+            return handler.send_body(200, json.dumps({'count': self.events, 'maxAllowed': 20000}).encode())
+        if path != FDSN_QUERY_PATH:
+            return handler.send_body(404, b'Not Found')
+        with self.lock:
+            body, compressed = self.bodies[self.requests % len(self.bodies)]
+            self.requests += 1
+        if 'gzip' in handler.headers.get('Accept-Encoding', ''):
+            return handler.send_body(200, compressed, headers={'Content-Encoding': 'gzip'})
+        return handler.send_body(200, body)
+
+
+class FakeS3:
+    """Just enough of the S3 REST API for boto3's put/get/list and multipart uploads, path-style.
+
+    Objects live under `root/<bucket>/<key>` on disk, so a benchmark's landed files can be
+    fed straight to the dbt `local` target afterwards.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def object_path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def handle(self, handler):
+        url = urlsplit(handler.path)
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        bucket, _, key = unquote(url.path).lstrip('/').partition('/')
+        method = handler.command
+        if not key:
+            if method == 'GET':
+                return self.list_objects(handler, bucket, query.get('prefix', ''))
+            if method in ('PUT', 'HEAD'):
+                os.makedirs(os.path.join(self.root, bucket), exist_ok=True)
+                return handler.send_body(200, b'')
+        elif method == 'PUT' and 'uploadId' in query:
+            with self.lock:
+                self.uploads[query['uploadId']][int(query['partNumber'])] = handler.read_body()
+            return handler.send_body(200, b'', headers={'ETag': f'"{uuid.uuid4().hex}"'})
+        elif method == 'PUT':
+            self.write(bucket, key, handler.read_body())
+            return handler.send_body(200, b'', headers={'ETag': f'"{uuid.uuid4().hex}"'})
+        elif method == 'POST' and 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            with self.lock:
+                self.uploads[upload_id] = {}
+            return handler.send_xml(
+                f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>"
+                f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            )
+        elif method == 'POST' and 'uploadId' in query:
+            handler.read_body()
+            with self.lock:
+                parts = self.uploads.pop(query['uploadId'])
+            self.write(bucket, key, b''.join(parts[number] for number in sorted(parts)))
+            return handler.send_xml(
+                f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>"
+                f"<ETag>\"{uuid.uuid4().hex}\"</ETag></CompleteMultipartUploadResult>"
+            )
+        elif method in ('GET', 'HEAD'):
+            path = self.object_path(bucket, key)
+            if not os.path.isfile(path):
+                return handler.send_xml(
+                    f"<Error><Code>NoSuchKey</Code><Message>The specified key does not exist.</Message>"
+                    f"<Key>{escape(key)}</Key></Error>", status=404,
+                )
+            with open(path, 'rb') as f:
+                return handler.send_body(200, f.read(), head=method == 'HEAD')
+        elif method == 'DELETE':
+            if 'uploadId' in query:
+                with self.lock:
+                    self.uploads.pop(query['uploadId'], None)
+            elif os.path.isfile(self.object_path(bucket, key)):
+                os.remove(self.object_path(bucket, key))
+            return handler.send_body(204, b'')
+        return handler.send_body(405, b'Method Not Allowed')
+
+    def write(self, bucket, key, body):
+        path = self.object_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(body)
+
+    def list_objects(self, handler, bucket, prefix):
+        bucket_root = os.path.join(self.root, bucket)
+        keys = []
+        for directory, _, files in os.walk(bucket_root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), bucket_root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    keys.append((key, os.path.getsize(os.path.join(directory, name))))
+        contents = ''.join(
+            f"<Contents><Key>{escape(key)}</Key><Size>{size}</Size><StorageClass>STANDARD</StorageClass></Contents>"
+            for key, size in sorted(keys)
+        )
+        return handler.send_xml(
+            f"<ListBucketResult><Name>{bucket}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(keys)}</KeyCount>"
+            f"<MaxKeys>1000</MaxKeys><IsTruncated>false</IsTruncated>{contents}</ListBucketResult>"
+        )
+
+
+class FakeAirbyte:
+    """Airbyte public API v1 jobs endpoints; every sync job succeeds `sync_seconds` after it is created"""
+
+    def __init__(self, sync_seconds=0.5):
+        self.sync_seconds = sync_seconds
+        self.jobs = []
+        self.lock = threading.Lock()
+
+    def job_view(self, job):
+        elapsed = time.time() - job['created']
+        if job['status'] == 'cancelled':
+            status = 'cancelled'
+        elif elapsed >= self.sync_seconds:
+            status = 'succeeded'
+        else:
+            status = 'running'
+        started = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(job['created'])) + f".{int(job['created'] * 1000) % 1000:03d}Z"
+        return {
+            'jobId': job['jobId'],
+            'status': status,
+            'jobType': 'sync',
+            'connectionId': job['connectionId'],
+            'startTime': started,
+            'lastUpdatedAt': started,
+            'duration': f"PT{min(elapsed, self.sync_seconds):.3f}S",
+            'rowsSynced': 0,
+            'bytesSynced': 0,
+        }
+
+    def handle(self, handler):
+        url = urlsplit(handler.path)
+        path = url.path.removeprefix('/api/public/v1')
+        if path == '/health':
+            return handler.send_body(200, b'Successful operation')
+        if path == '/jobs' and handler.command == 'POST':
+            request = json.loads(handler.read_body() or b'{}')
+            with self.lock:
+                job = {'jobId': len(self.jobs) + 1, 'connectionId': request.get('connectionId'), 'created': time.time(), 'status': None}
+                self.jobs.append(job)
+            return handler.send_json(self.job_view(job))
+        if path == '/jobs' and handler.command == 'GET':
+            connection_id = parse_qs(url.query).get('connectionId', [None])[0]
+            with self.lock:
+                jobs = [job for job in reversed(self.jobs) if connection_id in (None, job['connectionId'])]
+            return handler.send_json({'data': [self.job_view(job) for job in jobs[:1]]})
+        match = re.fullmatch(r'/jobs/(\d+)', path)
+        if match and 0 < int(match.group(1)) <= len(self.jobs):
+            job = self.jobs[int(match.group(1)) - 1]
+            if handler.command == 'DELETE':
+                job['status'] = 'cancelled'
+            return handler.send_json(self.job_view(job))
+        return handler.send_body(404, b'Not Found')
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def send_body(self, status, body, headers=None, head=False):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        self.send_body(status, json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+
+    def send_xml(self, document, status=200):
+        body = f'<?xml version="1.0" encoding="UTF-8"?>{document}'.encode()
+        self.send_body(status, body, headers={'Content-Type': 'application/xml'})
+
+    def handle_request(self):
+        self.server.service.handle(self)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = handle_request
+
+
+def serve(service, host, port=0):
+    """Start `service` on a daemon thread and return its server; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_services(events, s3_root, sync_seconds, airbyte_host, ready, seed=0):
+    """Process entry point: start all three fakes and report their addresses on `ready`, a multiprocessing queue"""
+    fdsn = serve(FakeFDSN(events, seed=seed), '127.0.0.1')
+    s3 = serve(FakeS3(s3_root), '127.0.0.1')
+    airbyte = serve(FakeAirbyte(sync_seconds), airbyte_host, AIRBYTE_PORT)
+    ready.put({
+        'usgs_url': f"http://127.0.0.1:{fdsn.server_address[1]}{FDSN_QUERY_PATH}",
+        's3_endpoint': f"http://127.0.0.1:{s3.server_address[1]}",
+        'airbyte_server_name': airbyte.server_address[0],
+    })
+    threading.Event().wait()
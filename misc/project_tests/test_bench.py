@@ -0,0 +1,11 @@
+from project_bench.bench_pipeline import main
+
+
+def test_bench_clients_smoke(tmp_path):
+    results = main(['--events', '50', '--runs', '2', '--targets', 'clients', '--sync-seconds', '0',
+                    '--s3-root', str(tmp_path), '--output', str(tmp_path / 'results.json')])
+    assert results[0]['events'] == 100
+    assert set(results[0]['stages']) == {'fetch', 'upload', 'sync', 'run'}
+    # Both runs landed a file under the day partition, next to its manifest
+    assert len(list(tmp_path.glob('earthquake-bench/year=*/month=*/day=*/bench-*.json'))) == 2
+    assert (tmp_path / 'results.json').exists()
@@ -3,6 +3,17 @@ from unittest.mock import patch, MagicMock
 from project.connectors.airbyte_client import AirbyteClient
 from project.connectors.s3_client import S3Client
 from project.connectors.usgs_client import USGSClient
+from earthquake_common.watermark import WatermarkStore
+from project.connectors.geojson_stream import encode_feature_collection
+from earthquake_common.response_cache import ResponseCache
+from project.connectors.sync_coalescer import SyncCoalescer
+from earthquake_common.fingerprint import row_fingerprint, stamp_fingerprints
+from earthquake_common.metrics import MetricsRegistry
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import gzip
+import json
 import requests
 
 
@@ -30,6 +41,48 @@ def test_trigger_sync(airbyte_client):
         mocked_get.return_value.json.return_value = {"status": "succeeded"}
         airbyte_client.trigger_sync(connection_id="test-id")
 
+def test_wait_for_job_backoff(airbyte_client):
+    with patch.object(airbyte_client, "check_job_status", side_effect=["running", "running", "succeeded"]), \
+         patch("project.connectors.airbyte_client.time.sleep") as mocked_sleep:
+        assert airbyte_client.wait_for_job("123", initial_interval=1) == "succeeded"
+        assert [call.args[0] for call in mocked_sleep.call_args_list] == [1, 2]
+
+def test_wait_for_job_timeout_cancels(airbyte_client):
+    with patch.object(airbyte_client, "check_job_status", return_value="running"), \
+         patch.object(airbyte_client, "cancel_job") as mocked_cancel:
+        with pytest.raises(Exception):
+            airbyte_client.wait_for_job("123", timeout=-1)
+        mocked_cancel.assert_called_once_with("123")
+
+def test_wait_for_job_async(airbyte_client):
+    with patch.object(airbyte_client, "check_job_status", side_effect=["pending", "failed"]):
+        status = asyncio.run(airbyte_client.wait_for_job_async("123", initial_interval=0))
+        assert status == "failed"
+
+def test_sync_coalescer_batches_landings(airbyte_client):
+    coalescer = SyncCoalescer(airbyte_client, "conn")
+    with patch.object(airbyte_client, "latest_job", return_value={"jobId": 7, "status": "succeeded"}), \
+         patch.object(airbyte_client, "trigger_sync", return_value=8) as mocked_trigger:
+        coalescer.notify_landed()
+        coalescer.notify_landed()
+        assert coalescer.poll() == "8"
+        assert coalescer.poll() is None
+        mocked_trigger.assert_called_once_with("conn")
+
+def test_sync_coalescer_waits_for_in_flight_job(airbyte_client):
+    coalescer = SyncCoalescer(airbyte_client, "conn")
+    coalescer.notify_landed()
+    started_before = {"jobId": 7, "status": "running", "startTime": "2020-01-01T00:00:00Z"}
+    with patch.object(airbyte_client, "latest_job", return_value=started_before), \
+         patch.object(airbyte_client, "trigger_sync") as mocked_trigger:
+        assert coalescer.poll() is None
+        assert coalescer.pending == 1
+        mocked_trigger.assert_not_called()
+    started_after = {"jobId": 7, "status": "running", "startTime": "2999-01-01T00:00:00Z"}
+    with patch.object(airbyte_client, "latest_job", return_value=started_after):
+        assert coalescer.poll() == "7"
+        assert coalescer.pending == 0
+
 
 # S3Client tests
 @pytest.fixture
@@ -41,6 +94,57 @@ def test_upload_to_s3(s3_client):
         s3_client.upload_to_s3(data={"key": "value"}, s3_key="test/key")
         mocked_put.assert_called_once()
 
+def test_upload_stream(s3_client):
+    with patch.object(s3_client.s3_client, 'upload_fileobj') as mocked_upload:
+        s3_client.upload_stream(iter([b'{"features": ', b'[]}']), s3_key="test/key")
+        body = mocked_upload.call_args.args[0].read()
+        assert body == b'{"features": []}'
+        assert mocked_upload.call_args.args[2] == "key"
+
+def test_upload_to_s3_gzip():
+    client = S3Client(bucket_name="test-bucket", compression="gzip")
+    with patch.object(client.s3_client, 'put_object') as mocked_put:
+        key = client.upload_to_s3(data={"key": "value"}, s3_key="test/key.json")
+        assert key == "key.json.gz"
+        assert json.loads(gzip.decompress(mocked_put.call_args.kwargs["Body"])) == {"key": "value"}
+
+def test_upload_to_s3_multipart():
+    client = S3Client(bucket_name="test-bucket", multipart_threshold=8)
+    with patch.object(client.s3_client, 'put_object') as mocked_put, \
+         patch.object(client.s3_client, 'upload_fileobj') as mocked_upload:
+        client.upload_to_s3(data={"key": "value"}, s3_key="test/key.json")
+        mocked_put.assert_not_called()
+        assert mocked_upload.call_args.kwargs["Config"] is client.transfer_config
+        assert json.loads(mocked_upload.call_args.args[0].read()) == {"key": "value"}
+
+def test_upload_to_s3_partitioned(s3_client):
+    data = {"features": [{"properties": {"time": 1722513600000}}, {"properties": {"time": 1722517200000}}]}
+    with patch.object(s3_client.s3_client, 'put_object') as mocked_put:
+        key = s3_client.upload_to_s3(data=data, s3_key="test/key.json", partition_date=datetime.date(2024, 8, 1))
+        assert key == "year=2024/month=08/day=01/key.json"
+        manifest_call = mocked_put.call_args_list[1].kwargs
+        assert manifest_call["Key"] == "_manifests/year=2024/month=08/day=01/key.json.manifest.json"
+        entry = json.loads(manifest_call["Body"])
+        assert entry["rows"] == 2
+        assert entry["min_event_time"] == "2024-08-01T12:00:00.000Z"
+        assert entry["max_event_time"] == "2024-08-01T13:00:00.000Z"
+
+def test_find_keys_reads_partitions_near_range(s3_client):
+    entry = {"key": "year=2024/month=08/day=03/key.json", "min_event_time": "2024-08-01T12:00:00.000Z", "max_event_time": "2024-08-01T13:00:00.000Z"}
+    def read_manifest(partition_date):
+        return {"files": [entry] if partition_date == datetime.date(2024, 8, 3) else []}
+    with patch.object(s3_client, 'read_manifest', side_effect=read_manifest) as mocked_read:
+        keys = s3_client.find_keys("2024-08-01T00:00:00Z", "2024-08-01T23:59:59Z", lateness_days=2)
+        assert keys == [entry["key"]]
+        assert [call.args[0].day for call in mocked_read.call_args_list] == [30, 31, 1, 2, 3]
+
+def test_find_keys_sub_second_boundary(s3_client):
+    entry = {"key": "year=2024/month=08/day=01/key.json", "min_event_time": "2024-07-31T23:59:59.000Z", "max_event_time": "2024-08-01T00:00:00.500Z"}
+    with patch.object(s3_client, 'read_manifest', return_value={"files": [entry]}):
+        # Half a second past the start, so the entry overlaps even though it sorts below it as a string
+        assert s3_client.find_keys("2024-08-01T00:00:00Z", "2024-08-01T23:59:59Z", lateness_days=0) == [entry["key"]]
+        assert s3_client.find_keys("2024-08-01T00:00:01Z", "2024-08-01T23:59:59Z", lateness_days=0) == []
+
 def test_move_old_files(s3_client):
     with patch.object(s3_client.s3_client, 'list_objects_v2') as mocked_list, \
          patch.object(s3_client.s3_client, 'copy_object') as mocked_copy, \
@@ -57,18 +161,162 @@ def usgs_client():
     return USGSClient(url="https://earthquake.usgs.gov/fdsnws/event/1/query")
 
 def test_fetch_data(usgs_client):
-    with patch("requests.get") as mocked_get:
+    with patch.object(usgs_client.session, "get") as mocked_get:
         mocked_get.return_value.status_code = 200
         mocked_get.return_value.json.return_value = {"type": "FeatureCollection"}
         result = usgs_client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-02")
         assert result["type"] == "FeatureCollection"
 
 def test_fetch_data_failure(usgs_client):
-    with patch("requests.get") as mocked_get:
+    with patch.object(usgs_client.session, "get") as mocked_get, \
+         patch("project.connectors.usgs_client.time.sleep"):
         # Simulate a response with status code 500
         mocked_get.return_value.status_code = 500
+        mocked_get.return_value.headers = {}
         mocked_get.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError()
         
-        # Assert that HTTPError is raised
+        # Assert that HTTPError is raised once the retries are exhausted
         with pytest.raises(requests.exceptions.HTTPError):
             usgs_client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-02")
+        assert mocked_get.call_count == usgs_client.max_retries + 1
+
+def test_fetch_data_retry_after(usgs_client):
+    throttled = MagicMock(status_code=429, headers={"Retry-After": "7"})
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {"type": "FeatureCollection"}
+    with patch.object(usgs_client.session, "get", side_effect=[throttled, ok]), \
+         patch("project.connectors.usgs_client.time.sleep") as mocked_sleep:
+        result = usgs_client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-02")
+        assert result["type"] == "FeatureCollection"
+        mocked_sleep.assert_called_once_with(7)
+
+def test_fetch_data_updated_after(usgs_client):
+    with patch.object(usgs_client.session, "get") as mocked_get:
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.json.return_value = {"type": "FeatureCollection"}
+        usgs_client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-02", updated_after="2024-08-01T12:00:00.000")
+        assert mocked_get.call_args.kwargs["params"]["updatedafter"] == "2024-08-01T12:00:00.000"
+
+def test_stream_features(usgs_client):
+    body = json.dumps({
+        "type": "FeatureCollection",
+        "metadata": {"count": 2},
+        "features": [{"id": "a", "properties": {"updated": 1}}, {"id": "b", "properties": {"updated": 2}}],
+    }).encode()
+    with patch.object(usgs_client.session, "get") as mocked_get:
+        mocked_get.return_value.status_code = 200
+        # Split the body into small chunks so features straddle chunk boundaries
+        mocked_get.return_value.iter_content.return_value = [body[i:i + 16] for i in range(0, len(body), 16)]
+        stream = usgs_client.stream_features(start_time_str="2024-08-01", end_time_str="2024-08-02")
+        result = json.loads(b"".join(encode_feature_collection(stream)))
+        assert [feature["id"] for feature in result["features"]] == ["a", "b"]
+        assert result["metadata"] == {"count": 2}
+        assert stream.count == 2 and stream.max_updated == 2
+
+def test_fetch_data_conditional(tmp_path):
+    client = USGSClient(url="https://earthquake.usgs.gov/fdsnws/event/1/query", cache=ResponseCache(str(tmp_path / "cache.json")))
+    payload = {"metadata": {"generated": 1}, "features": [{"id": "a"}]}
+    with patch.object(client.session, "get") as mocked_get:
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.headers = {"ETag": '"v1"'}
+        mocked_get.return_value.json.return_value = payload
+        assert client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-02") == payload
+
+        # Nothing is cached until the payload has landed and the cache is committed
+        assert client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-02") == payload
+        client.cache.commit()
+
+        # Same features with fresh metadata is treated as unchanged
+        mocked_get.return_value.json.return_value = {"metadata": {"generated": 2}, "features": [{"id": "a"}]}
+        assert client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-03") is None
+
+        mocked_get.return_value.status_code = 304
+        assert client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-04") is None
+        assert mocked_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+
+def test_fetch_data_conditional_across_watermarks(tmp_path):
+    client = USGSClient(url="https://earthquake.usgs.gov/fdsnws/event/1/query", cache=ResponseCache(str(tmp_path / "cache.json")))
+    with patch.object(client.session, "get") as mocked_get:
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.headers = {"ETag": '"v1"'}
+        mocked_get.return_value.json.return_value = {"features": [{"id": "a"}]}
+        client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-02", updated_after="2024-08-01T00:00:00.000")
+        client.cache.commit()
+
+        # The watermark has moved since the landing, and the validators are still sent
+        mocked_get.return_value.json.return_value = {"features": []}
+        assert client.fetch_data(start_time_str="2024-08-01", end_time_str="2024-08-03", updated_after="2024-08-02T00:00:00.000") == {"features": []}
+        assert mocked_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+        # Empty payloads are never landed, so they are not staged either
+        assert client.cache.pending == {}
+        assert len(client.cache.entries) == 1
+
+def test_cache_commit_snapshot(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.json"))
+    response = MagicMock(headers={})
+    cache.stage("query", response, "hash1")
+    staged = dict(cache.pending)
+    # A later fetch restages the key before the first payload's upload finishes
+    cache.stage("query", response, "hash2")
+    cache.commit(staged)
+    assert cache.get("query")["content_hash"] == "hash1"
+    assert cache.pending["query"]["content_hash"] == "hash2"
+    cache.commit()
+    assert cache.get("query")["content_hash"] == "hash2"
+    assert cache.pending == {}
+
+def test_cache_shared_between_threads(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.json"))
+    response = MagicMock(headers={})
+    def stage_and_commit(index):
+        cache.stage(f"query{index % 7}", response, f"hash{index}")
+        cache.commit()
+    # Fetch threads stage while upload threads commit; each save must neither fail nor clash
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(stage_and_commit, range(200)))
+    assert json.loads((tmp_path / "cache.json").read_text())["pending"] == {}
+    assert [path.name for path in tmp_path.iterdir()] == ["cache.json"]
+
+
+# WatermarkStore tests
+def test_watermark_advance(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermark.json"))
+    assert store.read() is None
+    data = {"features": [{"properties": {"updated": 1722513600000}}, {"properties": {"updated": 1722517200000}}]}
+    assert store.advance(data) == 1722517200000
+    # An older payload never moves the watermark backwards
+    assert store.advance({"features": [{"properties": {"updated": 1722510000000}}]}) == 1722517200000
+    assert store.read() == 1722517200000
+
+
+# Fingerprint tests
+def test_fingerprint_tracks_revisions():
+    feature = {"id": "us7000abcd", "geometry": {"coordinates": [-122.5, 37.75, 8.2]}, "properties": {"updated": 1722517200000}}
+    revised = dict(feature, properties={"updated": 1722520800000})
+    assert -2**63 <= row_fingerprint(feature) < 2**63
+    assert row_fingerprint(revised) != row_fingerprint(feature)
+    # Only the id and updated time feed the fingerprint
+    assert row_fingerprint(dict(feature, geometry=None)) == row_fingerprint(feature)
+    stamped = next(stamp_fingerprints([dict(feature)]))
+    assert stamped["fingerprint"] == row_fingerprint(feature)
+
+
+# Metrics tests
+def test_metrics_render():
+    registry = MetricsRegistry()
+    registry.observe("usgs_request_seconds", 0.5)
+    registry.observe("usgs_request_seconds", 1.5)
+    registry.inc("usgs_requests_total", status=200)
+    registry.set("dbt_node_seconds", 2.0, node='model.dbt_earthquake."quoted"')
+    text = registry.render()
+    assert "# TYPE usgs_request_seconds summary" in text
+    assert "usgs_request_seconds_count 2\nusgs_request_seconds_sum 2.0" in text
+    assert 'usgs_requests_total{status="200"} 1' in text
+    assert 'dbt_node_seconds{node="model.dbt_earthquake.\\"quoted\\""} 2.0' in text
+
+def test_metrics_shared_file(tmp_path):
+    # Registries in separate processes add to the same series through the file
+    path = str(tmp_path / "metrics.json")
+    MetricsRegistry(path).inc("s3_upload_bytes_total", 100)
+    MetricsRegistry(path).inc("s3_upload_bytes_total", 50)
+    assert "s3_upload_bytes_total 150" in MetricsRegistry(path).render()
@@ -0,0 +1,35 @@
+import datetime
+import pytz
+from unittest.mock import MagicMock
+from historical import BackfillEngine
+from project.connectors.geojson_stream import FeatureStream
+
+
+def make_engine(tmp_path, counts):
+    usgs_client = MagicMock()
+    usgs_client.count.side_effect = lambda start, end: (counts(start, end), 20000)
+    usgs_client.stream_features.side_effect = lambda start, end: FeatureStream([b'{"type": "FeatureCollection", "features": []}'])
+    s3_client = MagicMock()
+    engine = BackfillEngine(usgs_client, s3_client, journal_path=str(tmp_path / "journal.jsonl"), max_workers=2)
+    return engine, usgs_client, s3_client
+
+
+def test_split_window_until_under_cap(tmp_path):
+    # The first half of January is too large for one query, everything else fits
+    engine, _, _ = make_engine(tmp_path, lambda start, end: 30000 if start == "2020-01-01T00:00:00" and end > "2020-01-16T12:00:00" else 100)
+    start = datetime.datetime(2020, 1, 1, tzinfo=pytz.UTC)
+    end = datetime.datetime(2020, 2, 1, tzinfo=pytz.UTC)
+    chunks = engine.split_window(start, end)
+    assert [(s.day, e.day) for s, e, _ in chunks] == [(1, 16), (16, 1)]
+
+
+def test_run_resumes_from_journal(tmp_path):
+    engine, usgs_client, s3_client = make_engine(tmp_path, lambda start, end: 100)
+    start = datetime.datetime(2020, 1, 1, tzinfo=pytz.UTC)
+    end = datetime.datetime(2020, 3, 1, tzinfo=pytz.UTC)
+    assert engine.run(start, end) == 2
+    assert s3_client.upload_stream.call_count == 2
+
+    # A second run finds both months in the journal and fetches nothing
+    assert engine.run(start, end) == 0
+    assert usgs_client.stream_features.call_count == 2
@@ -0,0 +1,36 @@
+import datetime
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+from project.connectors.parquet_landing import ParquetLander, flatten_feature
+from earthquake_common.fingerprint import row_fingerprint
+
+
+FEATURE = {
+    "id": "us7000abcd",
+    "geometry": {"coordinates": [-122.5, 37.75, 8.2]},
+    "properties": {
+        "mag": 4.1, "place": "10 km N of Somewhere", "time": 1722513600000, "updated": 1722517200000,
+        "felt": None, "tsunami": 0, "sig": 271, "net": "us", "magType": "mb", "type": "earthquake",
+    },
+}
+
+
+def test_flatten_feature_types():
+    row = flatten_feature(FEATURE, "batch", datetime.datetime(2024, 8, 1, tzinfo=datetime.timezone.utc))
+    assert row["longitude"] == -122.5 and row["depth"] == 8.2
+    assert row["magnitude"] == 4.1 and row["significance"] == 271
+    assert row["felt_reports"] is None and row["tsunami"] is False
+    assert row["event_time"] == datetime.datetime(2024, 8, 1, 12, 0)
+    assert row["event_date"] == datetime.date(2024, 8, 1)
+    assert row["load_id"] == row_fingerprint(FEATURE)
+
+
+
+def test_write_partitions_by_event_date(tmp_path):
+    lander = ParquetLander(str(tmp_path), batch_size=1)
+    second = dict(FEATURE, id="us7000efgh", properties=dict(FEATURE["properties"], time=1722600000000))
+    lander.write({"features": [FEATURE, second]}, batch_id="batch")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["event_date=2024-08-01", "event_date=2024-08-02"]
+    table = pq.read_table(tmp_path / "event_date=2024-08-01")
+    assert table.column("id").to_pylist() == ["us7000abcd"]